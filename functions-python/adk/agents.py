@@ -12,6 +12,7 @@ from .tools import (
     latest_signals_tool,
     market_news_tool,
     technical_analysis_tool,
+    technical_analysis_batch_tool,
     calculate_signal_tool,
     knowledge_tool,
     memory_search_tool,
@@ -58,10 +59,11 @@ technical_research_agent = LlmAgent(
     instruction=(
         'You are a technical research analyst.\n\n'
         'Extract the primary asset symbol from the user request and call technical_analysis.\n'
+        'If the request covers several assets, call technical_analysis_batch once with all of their symbols.\n'
         'If you cannot identify a symbol, respond with "No symbol detected for technical analysis."\n'
         'Summarize: trend, current price, RSI, MACD histogram, and key levels.'
     ),
-    tools=[technical_analysis_tool],
+    tools=[technical_analysis_tool, technical_analysis_batch_tool],
     output_key=config.RESEARCH_STATE_KEYS['technical'],
     disallow_transfer_to_parent=True,
     disallow_transfer_to_peers=True,
@@ -100,6 +102,7 @@ rag_research_agent = LlmAgent(
     instruction=(
         'You are a knowledge base analyst.\n\n'
         'Use search_knowledge_base to retrieve relevant excerpts for concepts, strategies, or risk guidance.\n'
+        'When the user asks for a specific kind of source or a named title, pass source_type (books, articles, pdfs, github) or title.\n'
         'If the request is purely price-focused with no conceptual angle, reply "No RAG lookup needed."\n'
         'Return bullet points with source titles and short excerpts.'
     ),
@@ -278,7 +281,7 @@ strategy_agent = LlmAgent(
         '- stopLoss and takeProfit levels when applicable\n\n'
         'Be conservative. When in doubt, recommend HOLD.'
     ),
-    tools=[technical_analysis_tool, calculate_signal_tool, chart_tool],
+    tools=[technical_analysis_tool, technical_analysis_batch_tool, calculate_signal_tool, chart_tool],
     generate_content_config=types.GenerateContentConfig(
         temperature=get_temperature_for_model(config.MODEL_PRO, 0.3),
         safety_settings=get_safety_settings(),
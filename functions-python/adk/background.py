@@ -0,0 +1,150 @@
+"""Long-lived event loop shared by request handlers and background jobs."""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import queue
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Coroutine, Dict, Iterator, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class EventLoopThread:
+    """One asyncio loop running forever on a daemon thread.
+
+    Synchronous (WSGI) handlers hand coroutines to it instead of building a loop
+    per request with ``asyncio.run``, so concurrent requests share the loop, its
+    Firestore client and any in-flight work.
+    """
+
+    def __init__(self, *, name: str = 'event-loop') -> None:
+        self._name = name
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name=self._name, daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def owns(self, loop: asyncio.AbstractEventLoop) -> bool:
+        """Whether ``loop`` is this thread's loop, without starting it."""
+        with self._lock:
+            return self._loop is loop
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> concurrent.futures.Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        """Runs ``coro`` on the loop and blocks the calling thread until it finishes."""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iterate(self, items: AsyncIterator[T]) -> Iterator[T]:
+        """Bridges an async iterator to a blocking one; closing the result cancels the producer."""
+        results: queue.Queue = queue.Queue()
+
+        async def pump() -> None:
+            try:
+                async for item in items:
+                    results.put((False, item))
+                results.put((True, None))
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                results.put((True, exc))
+            finally:
+                aclose = getattr(items, 'aclose', None)
+                if aclose is not None:
+                    await aclose()
+
+        future = self.submit(pump())
+        try:
+            while True:
+                finished, value = results.get()
+                if finished:
+                    if value is not None:
+                        raise value
+                    return
+                yield value
+        finally:
+            future.cancel()
+
+
+class BackgroundQueue:
+    """Runs coroutines on the shared event loop, at most one pending job per key.
+
+    Tasks created on a request's own loop would die with it; jobs submitted here
+    outlive the request that queued them.
+    """
+
+    def __init__(self, event_loop: EventLoopThread, *, name: str = 'background') -> None:
+        self._event_loop = event_loop
+        self._name = name
+        self._lock = threading.Lock()
+        self._pending: Dict[str, concurrent.futures.Future] = {}
+        # Jobs to run once more after the pending job for the key finishes.
+        self._reruns: Dict[str, Callable[[], Awaitable[Any]]] = {}
+        self._stats = {'submitted': 0, 'deduplicated': 0, 'rerun': 0, 'failed': 0}
+
+    def submit(self, key: str, job: Callable[[], Awaitable[Any]], *, rerun: bool = False) -> bool:
+        """Schedules ``job()`` unless a job for ``key`` is still pending; returns whether it was queued.
+
+        With ``rerun``, a submit that finds a pending job is not dropped: ``job()``
+        runs once more after it, for work queued after the running job last looked.
+        """
+        loop = self._event_loop.loop
+        with self._lock:
+            if key in self._pending:
+                if rerun:
+                    self._reruns[key] = job
+                self._stats['deduplicated'] += 1
+                return False
+            self._pending[key] = asyncio.run_coroutine_threadsafe(self._run(key, job), loop)
+            self._stats['submitted'] += 1
+            return True
+
+    async def _run(self, key: str, job: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            return await job()
+        except Exception as exc:  # pragma: no cover - network/runtime dependent
+            print(f'[Background] {self._name} job {key} failed: {exc}')
+            with self._lock:
+                self._stats['failed'] += 1
+            return None
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+                job = self._reruns.pop(key, None)
+                if job is not None:
+                    self._pending[key] = asyncio.run_coroutine_threadsafe(self._run(key, job), self._event_loop.loop)
+                    self._stats['rerun'] += 1
+
+    def is_pending(self, key: str) -> bool:
+        with self._lock:
+            return key in self._pending
+
+    def wait(self, timeout: Optional[float] = None) -> None:
+        """Blocks until the currently pending jobs finish (or ``timeout`` elapses)."""
+        with self._lock:
+            futures = list(self._pending.values())
+        if futures:
+            concurrent.futures.wait(futures, timeout=timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'name': self._name, 'pending': len(self._pending), **self._stats}
+
+
+event_loop = EventLoopThread(name='adk-loop')
+background_queue = BackgroundQueue(event_loop, name='adk-background')
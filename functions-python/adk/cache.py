@@ -1,40 +1,341 @@
-"""Simple TTL cache for ADK helpers."""
+"""Thread-safe TTL cache for ADK helpers."""
 
 from __future__ import annotations
 
+import asyncio
+import pickle
+import threading
 import time
 from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Generic, Optional, TypeVar
+from typing import Any, Awaitable, Callable, Dict, Generic, Optional, Set, Tuple, TypeVar
+
+from .background import background_queue
+from .cache_backends import CacheBackend
+from .singleflight import SingleFlight
 
 T = TypeVar('T')
 
 
 @dataclass
 class _CacheEntry(Generic[T]):
-    value: T
+    value: Optional[T]
     expires_at: float
+    stale_until: float
+    missing: bool = False
 
 
 class TtlCache(Generic[T]):
-    def __init__(self, *, max_size: int = 200, ttl_seconds: int = 120) -> None:
+    """LRU cache with per-entry TTL, negative entries and optional stale-while-revalidate.
+
+    ``get``/``set`` behave like a plain TTL cache. ``get_or_load`` adds the rest:
+    a loader returning ``None`` is cached as a miss for ``negative_ttl_seconds``,
+    and an entry expired less than ``stale_seconds`` ago is returned as-is while a
+    background refresh runs.
+
+    With a ``backend``, values are also written through to a shared second tier
+    (pickled with their expiry, so the backend must authenticate payloads, see
+    ``SignedCacheBackend``) and looked up there on a local miss; ``promote``
+    controls whether such hits are copied into the local tier. The async path
+    does its tier I/O in a worker thread.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_size: int = 200,
+        ttl_seconds: int = 120,
+        negative_ttl_seconds: int = 0,
+        stale_seconds: int = 0,
+        name: str = 'cache',
+        backend: Optional[CacheBackend] = None,
+        promote: bool = True,
+    ) -> None:
         self._max_size = max(1, max_size)
         self._ttl_seconds = max(1, ttl_seconds)
+        self._negative_ttl_seconds = max(0, negative_ttl_seconds)
+        self._stale_seconds = max(0, stale_seconds)
+        self._name = name
+        self._backend = backend
+        self._promote = promote
         self._data: OrderedDict[str, _CacheEntry[T]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight[Optional[T]]()
+        self._async_calls: Dict[str, asyncio.Future] = {}
+        self._refreshing: Set[str] = set()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'stale_hits': 0,
+            'negative_hits': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'refreshes': 0,
+            'refresh_errors': 0,
+            'coalesced': 0,
+            'l2_hits': 0,
+            'l2_misses': 0,
+            'l2_errors': 0,
+        }
 
-    def get(self, key: str) -> Optional[T]:
+    def _lookup(self, key: str, now: float) -> Optional[_CacheEntry[T]]:
         entry = self._data.get(key)
-        if not entry:
+        if entry is None:
             return None
-        if entry.expires_at < time.time():
+        if entry.stale_until <= now:
             self._data.pop(key, None)
+            self._stats['expirations'] += 1
             return None
         self._data.move_to_end(key)
-        return entry.value
+        return entry
+
+    def _l2_key(self, key: str) -> str:
+        return f'{self._name}:{key}'
+
+    def _read_l2(self, key: str, now: float) -> Optional[_CacheEntry[T]]:
+        try:
+            payload = self._backend.get(self._l2_key(key))
+            record = pickle.loads(payload) if payload is not None else None
+        except Exception as exc:  # pragma: no cover - backend dependent
+            with self._lock:
+                self._stats['l2_errors'] += 1
+            print(f'[Cache] {self._name} L2 read failed: {exc}')
+            return None
+
+        with self._lock:
+            if record is None:
+                self._stats['l2_misses'] += 1
+                return None
+            expires_at, value = record
+            entry = _CacheEntry(value=value, expires_at=expires_at, stale_until=expires_at + self._stale_seconds)
+            if entry.stale_until <= now:
+                self._stats['l2_misses'] += 1
+                return None
+            self._stats['l2_hits'] += 1
+            if self._promote:
+                self._insert(key, entry, now)
+            return entry
+
+    def _write_l2(self, key: str, entry: _CacheEntry[T], now: float) -> None:
+        try:
+            payload = pickle.dumps((entry.expires_at, entry.value), protocol=pickle.HIGHEST_PROTOCOL)
+            self._backend.set(self._l2_key(key), payload, entry.stale_until - now)
+        except Exception as exc:  # pragma: no cover - backend dependent
+            with self._lock:
+                self._stats['l2_errors'] += 1
+            print(f'[Cache] {self._name} L2 write failed: {exc}')
 
-    def set(self, key: str, value: T) -> None:
-        expires_at = time.time() + self._ttl_seconds
-        self._data[key] = _CacheEntry(value=value, expires_at=expires_at)
+    def _entry(self, key: str, now: float) -> Optional[_CacheEntry[T]]:
+        with self._lock:
+            entry = self._lookup(key, now)
+        if entry is None and self._backend is not None:
+            entry = self._read_l2(key, now)
+        return entry
+
+    def get(self, key: str) -> Optional[T]:
+        now = time.time()
+        entry = self._entry(key, now)
+        with self._lock:
+            if entry is None or entry.expires_at <= now:
+                self._stats['misses'] += 1
+                return None
+            if entry.missing:
+                self._stats['negative_hits'] += 1
+                return None
+            self._stats['hits'] += 1
+            return entry.value
+
+    def set(self, key: str, value: T, *, ttl_seconds: Optional[float] = None) -> None:
+        self._store(key, value, self._ttl_seconds if ttl_seconds is None else ttl_seconds, missing=False)
+
+    def set_missing(self, key: str, *, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self._negative_ttl_seconds if ttl_seconds is None else ttl_seconds
+        if ttl > 0:
+            self._store(key, None, ttl, missing=True)
+
+    def _store(self, key: str, value: Optional[T], ttl_seconds: float, *, missing: bool) -> None:
+        now = time.time()
+        expires_at = now + max(0.0, ttl_seconds)
+        # Negative entries are never served stale; a failed lookup should be retried once it expires.
+        stale_until = expires_at if missing else expires_at + self._stale_seconds
+        entry = _CacheEntry(value=value, expires_at=expires_at, stale_until=stale_until, missing=missing)
+        with self._lock:
+            self._insert(key, entry, now)
+        # Negative entries stay local so one instance's outage is not shared with the others.
+        if self._backend is not None and not missing:
+            self._write_l2(key, entry, now)
+
+    def _insert(self, key: str, entry: _CacheEntry[T], now: float) -> None:
+        self._data[key] = entry
         self._data.move_to_end(key)
+        if len(self._data) > self._max_size:
+            self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        for key in [key for key, entry in self._data.items() if entry.stale_until <= now]:
+            self._data.pop(key, None)
+            self._stats['expirations'] += 1
         while len(self._data) > self._max_size:
             self._data.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+        if self._backend is not None:
+            try:
+                self._backend.delete(self._l2_key(key))
+            except Exception as exc:  # pragma: no cover - backend dependent
+                print(f'[Cache] {self._name} L2 delete failed: {exc}')
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'name': self._name, 'size': len(self._data), **self._stats}
+
+    def _resolve(self, key: str) -> Tuple[bool, Optional[T], bool]:
+        """Returns ``(found, value, stale)`` for ``get_or_load``."""
+        now = time.time()
+        return self._classify(self._entry(key, now), now)
+
+    async def _aresolve(self, key: str) -> Tuple[bool, Optional[T], bool]:
+        # Same as ``_resolve``, but a blocking L2 read must not stall the shared event loop.
+        now = time.time()
+        with self._lock:
+            entry = self._lookup(key, now)
+        if entry is None and self._backend is not None:
+            entry = await asyncio.to_thread(self._read_l2, key, now)
+        return self._classify(entry, now)
+
+    def _classify(self, entry: Optional[_CacheEntry[T]], now: float) -> Tuple[bool, Optional[T], bool]:
+        with self._lock:
+            if entry is None:
+                self._stats['misses'] += 1
+                return False, None, False
+            stale = entry.expires_at <= now
+            if entry.missing:
+                self._stats['negative_hits'] += 1
+            elif stale:
+                self._stats['stale_hits'] += 1
+            else:
+                self._stats['hits'] += 1
+            return True, entry.value, stale
+
+    def _remember(self, key: str, value: Optional[T], ttl_seconds: Optional[float]) -> Optional[T]:
+        if value is None:
+            self.set_missing(key)
+        else:
+            self.set(key, value, ttl_seconds=ttl_seconds)
+        return value
+
+    async def _aremember(self, key: str, value: Optional[T], ttl_seconds: Optional[float]) -> Optional[T]:
+        if self._backend is None:
+            return self._remember(key, value, ttl_seconds)
+        return await asyncio.to_thread(self._remember, key, value, ttl_seconds)
+
+    def _load(self, key: str, loader: Callable[[], Optional[T]], ttl_seconds: Optional[float]) -> Optional[T]:
+        return self._remember(key, loader(), ttl_seconds)
+
+    def _refresh_in_background(self, key: str, refresh: Callable[[], Any]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self._stats['refreshes'] += 1
+
+        def run() -> None:
+            try:
+                refresh()
+            except Exception as exc:  # pragma: no cover - loader dependent
+                with self._lock:
+                    self._stats['refresh_errors'] += 1
+                print(f'[Cache] {self._name} refresh failed for {key}: {exc}')
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f'{self._name}-refresh', daemon=True).start()
+
+    def get_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Optional[T]],
+        *,
+        ttl_seconds: Optional[float] = None,
+    ) -> Optional[T]:
+        found, value, stale = self._resolve(key)
+        if found:
+            if stale:
+                self._refresh_in_background(key, lambda: self._load(key, loader, ttl_seconds))
+            return value
+        return self._flight.do(key, lambda: self._load(key, loader, ttl_seconds))
+
+    async def aget_or_load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Optional[T]]],
+        *,
+        ttl_seconds: Optional[float] = None,
+    ) -> Optional[T]:
+        found, value, stale = await self._aresolve(key)
+        if found:
+            if stale:
+                self._arefresh_in_background(key, loader, ttl_seconds)
+            return value
+
+        # Concurrent misses on the same loop share one load, like the SingleFlight in ``get_or_load``.
+        loop = asyncio.get_running_loop()
+        future: Optional[asyncio.Future] = None
+        with self._lock:
+            pending = self._async_calls.get(key)
+            if pending is not None and pending.get_loop() is loop:
+                self._stats['coalesced'] += 1
+            else:
+                pending = None
+                if key not in self._async_calls:
+                    future = self._async_calls[key] = loop.create_future()
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        try:
+            value = await self._aremember(key, await loader(), ttl_seconds)
+        except asyncio.CancelledError:
+            if future is not None:
+                future.cancel()
+            raise
+        except Exception as exc:
+            if future is not None:
+                future.set_exception(exc)
+                future.exception()  # marks it retrieved when nobody else was waiting
+            raise
+        else:
+            if future is not None:
+                future.set_result(value)
+            return value
+        finally:
+            if future is not None:
+                with self._lock:
+                    if self._async_calls.get(key) is future:
+                        del self._async_calls[key]
+
+    def _arefresh_in_background(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Optional[T]]],
+        ttl_seconds: Optional[float],
+    ) -> None:
+        # Runs on the shared long-lived loop, which owns the services' clients, not on a private one.
+        async def refresh() -> None:
+            try:
+                await self._aremember(key, await loader(), ttl_seconds)
+            except Exception as exc:  # pragma: no cover - loader dependent
+                with self._lock:
+                    self._stats['refresh_errors'] += 1
+                print(f'[Cache] {self._name} refresh failed for {key}: {exc}')
+
+        if background_queue.submit(f'refresh:{self._name}:{key}', refresh):
+            with self._lock:
+                self._stats['refreshes'] += 1
@@ -0,0 +1,164 @@
+"""Shared second-tier backends for TtlCache."""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import math
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Optional
+
+from . import config
+
+
+class CacheBackend(ABC):
+    """Byte store with per-key expiry shared between instances."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+
+class SqliteCacheBackend(CacheBackend):
+    """File-backed tier, local to the instance unless ``path`` is on a volume every instance mounts."""
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)'
+        )
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM cache WHERE key = ? AND expires_at > ?',
+                (key, time.time()),
+            ).fetchone()
+        return bytes(row[0]) if row else None
+
+    def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, sqlite3.Binary(value), now + ttl_seconds),
+            )
+            self._writes += 1
+            if self._writes % 500 == 0:
+                self._conn.execute('DELETE FROM cache WHERE expires_at <= ?', (now,))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+
+class RedisCacheBackend(CacheBackend):
+    """Any client exposing the redis-py ``get``/``set(ex=)``/``delete`` calls (redis, fakeredis, ...)."""
+
+    def __init__(self, client: Any, *, prefix: str = 'tradesync:') -> None:
+        self._client = client
+        self._prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> 'RedisCacheBackend':
+        import redis
+
+        return cls(redis.Redis.from_url(url, socket_timeout=0.25, socket_connect_timeout=0.5))
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(self._prefix + key)
+
+    def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        self._client.set(self._prefix + key, value, ex=max(1, math.ceil(ttl_seconds)))
+
+    def delete(self, key: str) -> None:
+        self._client.delete(self._prefix + key)
+
+
+class SignedCacheBackend(CacheBackend):
+    """Prefixes every payload with an HMAC-SHA256 tag and drops payloads whose tag does not verify.
+
+    TtlCache unpickles what the tier returns, so only payloads written with the same
+    key may reach it; anything else written to the store is treated as a miss.
+    """
+
+    def __init__(self, inner: CacheBackend, key: bytes) -> None:
+        self._inner = inner
+        self._key = key
+
+    def _tag(self, value: bytes) -> bytes:
+        return hmac.new(self._key, value, hashlib.sha256).digest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        payload = self._inner.get(key)
+        if payload is None or len(payload) < 32:
+            return None
+        tag, value = payload[:32], payload[32:]
+        if not hmac.compare_digest(tag, self._tag(value)):
+            print(f'[Cache] Dropping unsigned or tampered L2 payload for {key}')
+            return None
+        return value
+
+    def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        self._inner.set(key, self._tag(value) + value, ttl_seconds)
+
+    def delete(self, key: str) -> None:
+        self._inner.delete(key)
+
+
+_backend: Optional[CacheBackend] = None
+_backend_lock = threading.Lock()
+_backend_loaded = False
+
+
+def get_shared_backend() -> Optional[CacheBackend]:
+    """Backend selected by ``CACHE_BACKEND`` (``sqlite`` or ``redis``), or None when disabled or unavailable."""
+    global _backend, _backend_loaded
+    if _backend_loaded:
+        return _backend
+    with _backend_lock:
+        if _backend_loaded:
+            return _backend
+        kind = config.CACHE_BACKEND
+        signing_key = config.CACHE_SIGNING_KEY.encode('utf-8') if config.CACHE_SIGNING_KEY else None
+        try:
+            if kind == 'sqlite':
+                if not signing_key:
+                    print('[Cache] CACHE_BACKEND=sqlite requires CACHE_SIGNING_KEY; shared tier disabled')
+                else:
+                    _backend = SignedCacheBackend(
+                        SqliteCacheBackend(config.CACHE_SQLITE_PATH or '/tmp/tradesync_cache.sqlite3'),
+                        signing_key,
+                    )
+            elif kind == 'redis':
+                if not config.CACHE_REDIS_URL:
+                    print('[Cache] CACHE_BACKEND=redis but CACHE_REDIS_URL is not set; shared tier disabled')
+                elif not signing_key:
+                    print('[Cache] CACHE_BACKEND=redis requires CACHE_SIGNING_KEY; shared tier disabled')
+                else:
+                    _backend = SignedCacheBackend(RedisCacheBackend.from_url(config.CACHE_REDIS_URL), signing_key)
+        except Exception as exc:
+            print(f'[Cache] Failed to initialise {kind} backend, shared tier disabled: {exc}')
+            _backend = None
+        _backend_loaded = True
+        return _backend
@@ -49,24 +49,104 @@ RESEARCH_STATE_KEYS = {
 SUMMARY_STATE_KEY = 'app:summary'
 MEMORY_EVENT_COUNT_KEY = 'app:memory_last_event_count'
 SUMMARY_EVENT_COUNT_KEY = 'app:summary_last_event_count'
+# Timestamp of the first event not yet folded into the session summary.
+SUMMARY_OFFSET_KEY = 'app:summary_offset'
 
 # Session summarization
 SESSION_EVENT_LIMIT = _parse_number(os.getenv('SESSION_EVENT_LIMIT'), 50)
 SESSION_SUMMARY_TRIGGER = _parse_number(os.getenv('SESSION_SUMMARY_TRIGGER'), 40)
 SESSION_SUMMARY_KEEP = _parse_number(os.getenv('SESSION_SUMMARY_KEEP'), 12)
 SESSION_SUMMARY_COOLDOWN = _parse_number(os.getenv('SESSION_SUMMARY_COOLDOWN'), 20)
+SESSION_SUMMARY_TOKEN_BUDGET = _parse_number(os.getenv('SESSION_SUMMARY_TOKEN_BUDGET'), 4000)
+SESSION_CACHE_MAX = _parse_number(os.getenv('SESSION_CACHE_MAX'), 200)
+SESSION_CACHE_TTL_SECONDS = _parse_number(os.getenv('SESSION_CACHE_TTL_SECONDS'), 1800)
+SESSION_LIST_PAGE_SIZE = _parse_number(os.getenv('SESSION_LIST_PAGE_SIZE'), 50)
+# 'msgpack' (compact, versioned) or 'json' (legacy documents, readable by older deployments).
+SESSION_EVENT_ENCODING = os.getenv('SESSION_EVENT_ENCODING', 'msgpack').lower()
+# The TypeScript session service shares the ``sessions`` collection and reads and rewrites the
+# header's ``events`` array. While enabled, that array stays the event source and is rewritten on
+# every append; disable only once every writer uses the events subcollection, which then migrates it.
+SESSION_LEGACY_EVENTS_ARRAY = os.getenv('SESSION_LEGACY_EVENTS_ARRAY', 'true').lower() != 'false'
 
 # Memory service
 MEMORY_CACHE_TTL_SECONDS = _parse_number(os.getenv('MEMORY_CACHE_TTL_SECONDS'), 120)
 MEMORY_CACHE_MAX = _parse_number(os.getenv('MEMORY_CACHE_MAX'), 200)
+MEMORY_CACHE_STALE_SECONDS = _parse_number(os.getenv('MEMORY_CACHE_STALE_SECONDS'), 60)
+MEMORY_CACHE_NEGATIVE_TTL_SECONDS = _parse_number(os.getenv('MEMORY_CACHE_NEGATIVE_TTL_SECONDS'), 15)
 MEMORY_SEARCH_LIMIT = _parse_number(os.getenv('MEMORY_SEARCH_LIMIT'), 5)
 MEMORY_SUMMARY_WINDOW = _parse_number(os.getenv('MEMORY_SUMMARY_WINDOW'), 12)
 MEMORY_SUMMARY_MIN_EVENTS = _parse_number(os.getenv('MEMORY_SUMMARY_MIN_EVENTS'), 6)
 MEMORY_SAVE_EVERY_EVENTS = _parse_number(os.getenv('MEMORY_SAVE_EVERY_EVENTS'), 6)
+MEMORY_WRITE_BATCH = _parse_number(os.getenv('MEMORY_WRITE_BATCH'), 20)
+MEMORY_DEDUP_THRESHOLD = _parse_float(os.getenv('MEMORY_DEDUP_THRESHOLD'), 0.92)
+MEMORY_DEDUP_WINDOW = _parse_number(os.getenv('MEMORY_DEDUP_WINDOW'), 50)
+MEMORY_MATRIX_ENABLED = os.getenv('MEMORY_MATRIX_ENABLED', 'true').lower() != 'false'
+MEMORY_MATRIX_MAX_ROWS = _parse_number(os.getenv('MEMORY_MATRIX_MAX_ROWS'), 1000)
+MEMORY_MATRIX_CACHE_MAX = _parse_number(os.getenv('MEMORY_MATRIX_CACHE_MAX'), 500)
+MEMORY_MATRIX_TTL_SECONDS = _parse_number(os.getenv('MEMORY_MATRIX_TTL_SECONDS'), 900)
+MEMORY_RECENCY_WEIGHT = _parse_float(os.getenv('MEMORY_RECENCY_WEIGHT'), 0.05)
+MEMORY_RECENCY_HALF_LIFE_DAYS = _parse_float(os.getenv('MEMORY_RECENCY_HALF_LIFE_DAYS'), 30.0)
+
+# Maintenance
+SESSION_TTL_DAYS = _parse_number(os.getenv('SESSION_TTL_DAYS'), 90)
+MEMORY_CONSOLIDATE_AFTER_DAYS = _parse_number(os.getenv('MEMORY_CONSOLIDATE_AFTER_DAYS'), 30)
+MEMORY_CONSOLIDATE_THRESHOLD = _parse_float(os.getenv('MEMORY_CONSOLIDATE_THRESHOLD'), 0.85)
+MAINTENANCE_SCAN_LIMIT = _parse_number(os.getenv('MAINTENANCE_SCAN_LIMIT'), 5000)
+
+# Market data
+MARKET_DATA_MAX_WORKERS = _parse_number(os.getenv('MARKET_DATA_MAX_WORKERS'), 8)
+TECHNICAL_BATCH_MAX = _parse_number(os.getenv('TECHNICAL_BATCH_MAX'), 50)
+
+# Local OHLCV store
+PRICE_STORE_ENABLED = os.getenv('PRICE_STORE_ENABLED', 'true').lower() != 'false'
+PRICE_STORE_DIR = os.getenv('PRICE_STORE_DIR') or '/tmp/tradesync_prices'
+PRICE_STORE_REFRESH_SECONDS = _parse_number(os.getenv('PRICE_STORE_REFRESH_SECONDS'), 60)
+
+# Incremental indicator state
+INDICATOR_STATE_TTL_SECONDS = _parse_number(os.getenv('INDICATOR_STATE_TTL_SECONDS'), 21600)
+INDICATOR_STATE_MAX = _parse_number(os.getenv('INDICATOR_STATE_MAX'), 500)
+
+# Shared cache tier
+CACHE_BACKEND = (os.getenv('CACHE_BACKEND') or 'none').strip().lower()
+# The SQLite tier is a local file: it only survives restarts / is shared between processes on one
+# instance, unless CACHE_SQLITE_PATH points at a volume mounted by every instance.
+CACHE_SQLITE_PATH = os.getenv('CACHE_SQLITE_PATH') or '/tmp/tradesync_cache.sqlite3'
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+# HMAC key for payloads in the shared tier, the same on every process that shares it; the tier is
+# disabled without it.
+CACHE_SIGNING_KEY = os.getenv('CACHE_SIGNING_KEY')
+CACHE_L2_PROMOTE = os.getenv('CACHE_L2_PROMOTE', 'true').lower() != 'false'
+
+# Embeddings
+EMBEDDING_CACHE_MAX = _parse_number(os.getenv('EMBEDDING_CACHE_MAX'), 2000)
+EMBEDDING_CACHE_TTL_SECONDS = _parse_number(os.getenv('EMBEDDING_CACHE_TTL_SECONDS'), 604800)
+EMBEDDING_BATCH_SIZE = _parse_number(os.getenv('EMBEDDING_BATCH_SIZE'), 100)
+EMBEDDING_BATCH_CONCURRENCY = _parse_number(os.getenv('EMBEDDING_BATCH_CONCURRENCY'), 4)
+EMBEDDING_CACHE_PERSIST = os.getenv('EMBEDDING_CACHE_PERSIST', 'true').lower() != 'false'
 
 # RAG cache
 RAG_CACHE_TTL_SECONDS = _parse_number(os.getenv('RAG_CACHE_TTL_SECONDS'), 600)
 RAG_CACHE_MAX = _parse_number(os.getenv('RAG_CACHE_MAX'), 200)
+RAG_CACHE_STALE_SECONDS = _parse_number(os.getenv('RAG_CACHE_STALE_SECONDS'), 300)
+RAG_CACHE_NEGATIVE_TTL_SECONDS = _parse_number(os.getenv('RAG_CACHE_NEGATIVE_TTL_SECONDS'), 30)
+
+# Semantic query cache (RAG + memory): serves paraphrases of recent queries
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() != 'false'
+SEMANTIC_CACHE_THRESHOLD = _parse_float(os.getenv('SEMANTIC_CACHE_THRESHOLD'), 0.95)
+SEMANTIC_CACHE_MAX = _parse_number(os.getenv('SEMANTIC_CACHE_MAX'), 512)
+
+# Local RAG vector index (falls back to Firestore find_nearest until a snapshot is loaded)
+VECTOR_INDEX_ENABLED = os.getenv('VECTOR_INDEX_ENABLED', 'false').lower() == 'true'
+VECTOR_INDEX_DIR = os.getenv('VECTOR_INDEX_DIR') or '/tmp/tradesync_rag_index'
+VECTOR_INDEX_REFRESH_SECONDS = _parse_number(os.getenv('VECTOR_INDEX_REFRESH_SECONDS'), 300)
+VECTOR_INDEX_REBUILD_SECONDS = _parse_number(os.getenv('VECTOR_INDEX_REBUILD_SECONDS'), 21600)
+VECTOR_INDEX_IVF_MIN_ROWS = _parse_number(os.getenv('VECTOR_INDEX_IVF_MIN_ROWS'), 4096)
+VECTOR_INDEX_NPROBE = _parse_number(os.getenv('VECTOR_INDEX_NPROBE'), 16)
+
+# Hybrid RAG retrieval (BM25 + vector, reciprocal rank fusion)
+RAG_HYBRID_ENABLED = os.getenv('RAG_HYBRID_ENABLED', 'false').lower() == 'true'
+RAG_HYBRID_DEPTH = _parse_number(os.getenv('RAG_HYBRID_DEPTH'), 20)
+RAG_RRF_K = _parse_number(os.getenv('RAG_RRF_K'), 60)
 
 # Vertex AI Search / RAG
 VERTEX_AI_SEARCH_DATASTORE_ID = os.getenv('VERTEX_AI_SEARCH_DATASTORE_ID')
@@ -0,0 +1,154 @@
+"""Compact storage encoding and lazy decoding for session events."""
+
+from __future__ import annotations
+
+import threading
+import zlib
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import msgpack
+from google.adk.events import Event
+
+SCHEMA_VERSION = 1
+# Payloads below this size are stored uncompressed; zlib rarely pays off on short turns.
+_COMPRESS_MIN_BYTES = 1024
+
+
+def encode_event(event: Event, *, encoding: str = 'msgpack') -> Dict[str, Any]:
+    """Event document for the events subcollection.
+
+    ``timestamp``, ``id`` and ``author`` stay top-level so they can be queried
+    without decoding; the rest is a versioned msgpack payload, zlib-compressed
+    when large. ``encoding='json'`` writes the legacy plain document.
+    """
+    data = event.model_dump(by_alias=True, mode='json', exclude_none=True)
+    if encoding == 'json':
+        return data
+    payload = msgpack.packb(data, use_bin_type=True)
+    codec = 'msgpack'
+    if len(payload) >= _COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(payload, 6)
+        if len(compressed) < len(payload):
+            payload = compressed
+            codec = 'msgpack+zlib'
+    return {
+        'v': SCHEMA_VERSION,
+        'codec': codec,
+        'id': event.id,
+        'timestamp': event.timestamp,
+        'author': event.author,
+        'payload': payload,
+    }
+
+
+def decode_event(doc: Dict[str, Any]) -> Event:
+    """Inverse of ``encode_event``; documents without a schema version are legacy JSON events."""
+    if 'v' not in doc:
+        return Event.model_validate(doc)
+    if doc['v'] != SCHEMA_VERSION:
+        raise ValueError(f"Unsupported event schema version {doc['v']}")
+    payload = bytes(doc['payload'])
+    if doc.get('codec') == 'msgpack+zlib':
+        payload = zlib.decompress(payload)
+    return Event.model_validate(msgpack.unpackb(payload, raw=False))
+
+
+class EncodedEvent:
+    """A stored event that is decoded and validated once, on first ``get``."""
+
+    __slots__ = ('timestamp', '_doc', '_event', '_lock')
+
+    def __init__(self, doc: Dict[str, Any]) -> None:
+        self.timestamp = float(doc.get('timestamp') or 0)
+        self._doc: Optional[Dict[str, Any]] = doc
+        self._event: Optional[Event] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Event:
+        if self._event is None:
+            with self._lock:
+                if self._event is None:
+                    self._event = decode_event(self._doc or {})
+                    self._doc = None
+        return self._event
+
+
+def _decoded(item: Any) -> Any:
+    return item.get() if isinstance(item, EncodedEvent) else item
+
+
+class LazyEventList(list):
+    """Event list whose stored entries are decoded only when accessed.
+
+    Items are ``Event`` or ``EncodedEvent``. Indexing and iteration return decoded
+    events, slicing and ``after`` stay lazy; any other operation that inspects
+    items decodes the whole list first.
+    """
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return LazyEventList(list.__getitem__(self, index))
+        return _decoded(list.__getitem__(self, index))
+
+    def __iter__(self) -> Iterator[Event]:
+        index = 0
+        while index < len(self):
+            yield _decoded(list.__getitem__(self, index))
+            index += 1
+
+    def __reversed__(self) -> Iterator[Event]:
+        for index in range(len(self) - 1, -1, -1):
+            yield _decoded(list.__getitem__(self, index))
+
+    def pop(self, index: int = -1) -> Event:
+        return _decoded(list.pop(self, index))
+
+    def copy(self) -> 'LazyEventList':
+        return LazyEventList(list.__iter__(self))
+
+    def after(self, timestamp: float, *, inclusive: bool = False) -> 'LazyEventList':
+        """Entries newer than ``timestamp`` (or equal with ``inclusive``), without decoding them."""
+        if inclusive:
+            return LazyEventList(item for item in list.__iter__(self) if item.timestamp >= timestamp)
+        return LazyEventList(item for item in list.__iter__(self) if item.timestamp > timestamp)
+
+    def materialize(self) -> None:
+        for index, item in enumerate(list.__iter__(self)):
+            if isinstance(item, EncodedEvent):
+                list.__setitem__(self, index, item.get())
+
+    def __contains__(self, item: Any) -> bool:
+        self.materialize()
+        return list.__contains__(self, item)
+
+    def __eq__(self, other: Any) -> bool:
+        self.materialize()
+        if isinstance(other, LazyEventList):
+            other.materialize()
+        return list.__eq__(self, other)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __add__(self, other: Iterable[Any]) -> list:
+        self.materialize()
+        return list.__add__(self, list(other))
+
+    def __repr__(self) -> str:
+        self.materialize()
+        return list.__repr__(self)
+
+    def index(self, *args: Any) -> int:
+        self.materialize()
+        return list.index(self, *args)
+
+    def count(self, item: Any) -> int:
+        self.materialize()
+        return list.count(self, item)
+
+    def remove(self, item: Any) -> None:
+        self.materialize()
+        list.remove(self, item)
+
+    def sort(self, *args: Any, **kwargs: Any) -> None:
+        self.materialize()
+        list.sort(self, *args, **kwargs)
@@ -0,0 +1,39 @@
+"""Shared async Firestore client for TradeSync ADK (Python)."""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from typing import Optional
+
+import firebase_admin
+from google.cloud import firestore as gcp_firestore
+
+from .background import event_loop
+
+# gRPC aio channels are bound to the event loop that created them. All async
+# Firestore work runs on the shared loop, so one client lives for the process.
+_client: Optional[gcp_firestore.AsyncClient] = None
+_lock = threading.Lock()
+
+
+def _ensure_firebase() -> firebase_admin.App:
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app()
+    return firebase_admin.get_app()
+
+
+def get_async_client() -> gcp_firestore.AsyncClient:
+    """Async Firestore client of the shared event loop, created on first use."""
+    global _client
+
+    if not event_loop.owns(asyncio.get_running_loop()):
+        raise RuntimeError('The async Firestore client is only available on the shared event loop; use event_loop.run')
+    with _lock:
+        if _client is None:
+            app = _ensure_firebase()
+            _client = gcp_firestore.AsyncClient(
+                project=app.project_id,
+                credentials=app.credential.get_credential(),
+            )
+        return _client
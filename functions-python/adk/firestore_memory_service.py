@@ -1,9 +1,26 @@
-"""Firestore-backed memory service for ADK."""
+"""Firestore-backed memory service for ADK.
+
+``add_session_to_memory`` only queues the session window; a background job
+summarizes queued windows, embeds the summaries in one batched call, drops
+near-duplicates of the user's recent memories and writes the rest in a batch.
+
+Searches rank a per-user float32 matrix of memory embeddings in-process (cosine
+plus a recency boost). The matrix is loaded once per warm instance and extended
+in place by this instance's writes, which also invalidate the user's cached
+search results. Firestore ``find_nearest`` is only used when a user has more
+memories than ``MEMORY_MATRIX_MAX_ROWS``; for those users only a marker is cached.
+"""
 
 from __future__ import annotations
 
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import Optional
+from typing import Any, Dict, List, Optional
+
+import numpy as np
 
 import firebase_admin
 from firebase_admin import firestore
@@ -15,8 +32,12 @@ from google.cloud.firestore_v1.base_vector_query import DistanceMeasure
 from google.cloud.firestore_v1.vector import Vector
 
 from . import config
+from .background import background_queue
 from .cache import TtlCache
-from .genai_client import generate_embedding, summarize_conversation
+from .cache_backends import get_shared_backend
+from .firestore_client import get_async_client
+from .genai_client import generate_embedding, generate_embeddings, summarize_conversation
+from .semantic_cache import SemanticCache
 
 
 def _ensure_firebase() -> None:
@@ -24,43 +45,298 @@ def _ensure_firebase() -> None:
         firebase_admin.initialize_app()
 
 
+_GENERATION_TTL_SECONDS = 86400
+_MAX_WRITE_ATTEMPTS = 3
+
+
 def _scope_key(app_name: str, user_id: str) -> str:
     return f"{app_name}:{user_id}"
 
 
+@dataclass
+class _PendingMemory:
+    app_name: str
+    user_id: str
+    events: List[Any]
+    attempts: int = 0
+
+
+@dataclass
+class _UserMemories:
+    matrix: np.ndarray  # unit-length rows
+    contents: List[str]
+    timestamps: List[str]
+    created: np.ndarray  # epoch seconds
+    complete: bool
+    loaded_at: float
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+def _memory_entry(content: str, timestamp: str) -> MemoryEntry:
+    return MemoryEntry(
+        content={
+            'role': 'assistant',
+            'parts': [{'text': content}],
+        },
+        author='memory',
+        timestamp=timestamp or '',
+    )
+
+
 class FirestoreMemoryService(BaseMemoryService):
     def __init__(self) -> None:
         _ensure_firebase()
-        self._db = firestore.client()
+        self._lock = threading.Lock()
+        self._pending_writes: List[_PendingMemory] = []
+        # Bumped per scope on every write and part of the search cache key, so results
+        # cached before the write are never served. With a shared tier the generation
+        # is stored there too, so every instance keys its searches by it.
+        self._generations: Dict[str, str] = {}
+        self._backend = get_shared_backend()
         ttl_seconds = config.MEMORY_CACHE_TTL_SECONDS or 120
         max_size = config.MEMORY_CACHE_MAX or 200
-        self._cache = TtlCache[SearchMemoryResponse](max_size=max_size, ttl_seconds=ttl_seconds)
+        self._cache = TtlCache[SearchMemoryResponse](
+            max_size=max_size,
+            ttl_seconds=ttl_seconds,
+            negative_ttl_seconds=config.MEMORY_CACHE_NEGATIVE_TTL_SECONDS or 0,
+            stale_seconds=config.MEMORY_CACHE_STALE_SECONDS or 0,
+            name='memory',
+            backend=self._backend,
+            promote=config.CACHE_L2_PROMOTE,
+        )
+        self._semantic_cache = SemanticCache[SearchMemoryResponse](
+            max_size=config.SEMANTIC_CACHE_MAX or 512,
+            threshold=config.SEMANTIC_CACHE_THRESHOLD or 0.95,
+            ttl_seconds=ttl_seconds,
+            name='memory',
+        )
+        self._matrices = TtlCache[_UserMemories](
+            max_size=config.MEMORY_MATRIX_CACHE_MAX or 500,
+            ttl_seconds=config.MEMORY_MATRIX_TTL_SECONDS or 900,
+            name='memory-matrix',
+        )
 
     async def add_session_to_memory(self, session: Session):
+        """Queues the recent window of ``session``; summarizing and storing happen in the background."""
         events = session.events or []
         min_events = config.MEMORY_SUMMARY_MIN_EVENTS or 6
         if len(events) < min_events:
             return
 
         window = config.MEMORY_SUMMARY_WINDOW or 12
-        window_events = events[-window:] if window > 0 else events
-        summary = summarize_conversation(window_events)
-        if not summary:
+        window_events = list(events[-window:] if window > 0 else events)
+        with self._lock:
+            self._pending_writes.append(_PendingMemory(session.app_name, session.user_id, window_events))
+        # rerun: a drain that already found the list empty may still hold the key.
+        background_queue.submit('memory-writes', self._drain_writes, rerun=True)
+
+    async def _drain_writes(self) -> None:
+        batch_size = config.MEMORY_WRITE_BATCH or 20
+        while True:
+            with self._lock:
+                items = self._pending_writes[:batch_size]
+                del self._pending_writes[:batch_size]
+            if not items:
+                return
+            try:
+                await self._write_memories(items)
+            except Exception as exc:  # pragma: no cover - network/runtime dependent
+                for item in items:
+                    item.attempts += 1
+                retry = [item for item in items if item.attempts < _MAX_WRITE_ATTEMPTS]
+                dropped = [_scope_key(item.app_name, item.user_id) for item in items if item.attempts >= _MAX_WRITE_ATTEMPTS]
+                with self._lock:
+                    self._pending_writes.extend(retry)
+                print(f'[Memory] write failed, requeued {len(retry)}, dropped {dropped}: {exc}')
+
+    async def _write_memories(self, items: List[_PendingMemory]) -> None:
+        summaries = await asyncio.gather(
+            *(asyncio.to_thread(summarize_conversation, item.events) for item in items),
+            return_exceptions=True,
+        )
+        entries = [(item, summary) for item, summary in zip(items, summaries) if isinstance(summary, str) and summary]
+        if not entries:
+            return
+        matrix = await asyncio.to_thread(generate_embeddings, [summary for _, summary in entries], 'RETRIEVAL_DOCUMENT')
+
+        threshold = config.MEMORY_DEDUP_THRESHOLD or 0.92
+        db = get_async_client()
+        batch = db.batch()
+        recent_by_scope: Dict[str, np.ndarray] = {}
+        stored: List[tuple] = []
+        skipped = 0
+        for (item, summary), vector in zip(entries, matrix):
+            norm = float(np.linalg.norm(vector))
+            if norm == 0:
+                continue
+            unit = vector / norm
+            scope = _scope_key(item.app_name, item.user_id)
+            recent = recent_by_scope.get(scope)
+            if recent is None:
+                recent = await self._recent_embeddings(scope, unit.shape[0])
+            if recent.shape[0] and float(np.max(recent @ unit)) >= threshold:
+                skipped += 1
+                recent_by_scope[scope] = recent
+                continue
+            recent_by_scope[scope] = np.vstack([recent, unit[None, :]])
+            timestamp = datetime.now(timezone.utc).isoformat()
+            batch.set(db.collection('memories').document(), {
+                'appName': item.app_name,
+                'userId': item.user_id,
+                'scopeKey': scope,
+                'content': summary,
+                'embedding': Vector(vector.tolist()),
+                'timestamp': timestamp,
+                'createdAt': firestore.SERVER_TIMESTAMP,
+            })
+            stored.append((scope, summary, timestamp, unit))
+        if stored:
+            await batch.commit()
+            for scope, summary, timestamp, unit in stored:
+                self._extend_matrix(scope, summary, timestamp, unit)
+            for scope in {scope for scope, _, _, _ in stored}:
+                await self._invalidate_search(scope)
+        print(f'[Memory] stored {len(stored)} memories, skipped {skipped} near-duplicates')
+
+    def _read_generation(self, scope: str) -> str:
+        with self._lock:
+            local = self._generations.get(scope, '')
+        if self._backend is None:
+            return local
+        try:
+            stored = self._backend.get(f'memory-generation:{scope}')
+        except Exception as exc:  # pragma: no cover - backend dependent
+            print(f'[Memory] generation read failed: {exc}')
+            return local
+        return stored.decode('utf-8') if stored else local
+
+    def _write_generation(self, scope: str, generation: str) -> None:
+        with self._lock:
+            self._generations[scope] = generation
+        if self._backend is None:
             return
+        try:
+            # Outlives every search entry keyed by the previous generation.
+            self._backend.set(f'memory-generation:{scope}', generation.encode('utf-8'), _GENERATION_TTL_SECONDS)
+        except Exception as exc:  # pragma: no cover - backend dependent
+            print(f'[Memory] generation write failed: {exc}')
 
-        embedding = generate_embedding(summary, 'RETRIEVAL_DOCUMENT')
-        scope = _scope_key(session.app_name, session.user_id)
-        timestamp = datetime.now(timezone.utc).isoformat()
+    async def _generation(self, scope: str) -> str:
+        if self._backend is None:
+            return self._read_generation(scope)
+        return await asyncio.to_thread(self._read_generation, scope)
 
-        self._db.collection('memories').add({
-            'appName': session.app_name,
-            'userId': session.user_id,
-            'scopeKey': scope,
-            'content': summary,
-            'embedding': Vector(embedding),
-            'timestamp': timestamp,
-            'createdAt': firestore.SERVER_TIMESTAMP,
-        })
+    async def _invalidate_search(self, scope: str) -> None:
+        with self._lock:
+            previous = self._generations.get(scope, '')
+        await asyncio.to_thread(self._write_generation, scope, f'{time.time_ns():x}')
+        self._semantic_cache.invalidate(f'{scope}:{previous}')
+
+    def _extend_matrix(self, scope: str, content: str, timestamp: str, unit: np.ndarray) -> None:
+        # Published matrices are never mutated; a write swaps in an extended copy with the same expiry.
+        memories = self._matrices.get(scope)
+        if memories is None or not memories.complete or (memories.matrix.shape[0] and memories.matrix.shape[1] != unit.shape[0]):
+            return
+        remaining = (config.MEMORY_MATRIX_TTL_SECONDS or 900) - (time.time() - memories.loaded_at)
+        if remaining <= 0:
+            return
+        matrix = unit[None, :] if not memories.matrix.shape[0] else np.vstack([memories.matrix, unit[None, :]])
+        self._matrices.set(
+            scope,
+            _UserMemories(
+                matrix=np.ascontiguousarray(matrix, dtype=np.float32),
+                contents=memories.contents + [content],
+                timestamps=memories.timestamps + [timestamp],
+                created=np.append(memories.created, time.time()),
+                complete=memories.complete,
+                loaded_at=memories.loaded_at,
+            ),
+            ttl_seconds=remaining,
+        )
+
+    async def _recent_embeddings(self, scope: str, dimension: int) -> np.ndarray:
+        memories = self._matrices.get(scope)
+        if memories is not None and memories.matrix.shape[0] and memories.matrix.shape[1] == dimension:
+            window = config.MEMORY_DEDUP_WINDOW or 50
+            return memories.matrix[np.argsort(-memories.created)[:window]]
+        query = (
+            get_async_client().collection('memories')
+            .where(filter=FieldFilter('scopeKey', '==', scope))
+            .order_by('createdAt', direction=firestore.Query.DESCENDING)
+            .limit(config.MEMORY_DEDUP_WINDOW or 50)
+            .select(['embedding'])
+        )
+        rows = []
+        async for doc in query.stream():
+            embedding = (doc.to_dict() or {}).get('embedding')
+            if embedding is not None and len(embedding) == dimension:
+                rows.append(list(embedding))
+        return _unit_rows(np.asarray(rows, dtype=np.float32).reshape(-1, dimension))
+
+    async def _load_user_memories(self, scope: str) -> _UserMemories:
+        max_rows = config.MEMORY_MATRIX_MAX_ROWS or 1000
+        base_query = get_async_client().collection('memories').where(filter=FieldFilter('scopeKey', '==', scope))
+        counted = await base_query.limit(max_rows + 1).count(alias='rows').get()
+        if counted and counted[0] and counted[0][0].value > max_rows:
+            # Too large to rank in-process; cache only the marker so searches go straight to find_nearest.
+            return _UserMemories(
+                matrix=np.zeros((0, 0), dtype=np.float32),
+                contents=[],
+                timestamps=[],
+                created=np.zeros(0, dtype=np.float64),
+                complete=False,
+                loaded_at=time.time(),
+            )
+        query = (
+            base_query
+            .order_by('createdAt', direction=firestore.Query.DESCENDING)
+            .limit(max_rows)
+            .select(['content', 'embedding', 'timestamp', 'createdAt'])
+        )
+        rows: List[List[float]] = []
+        contents: List[str] = []
+        timestamps: List[str] = []
+        created: List[float] = []
+        async for doc in query.stream():
+            data = doc.to_dict() or {}
+            content = data.get('content', '')
+            embedding = data.get('embedding')
+            if not content or embedding is None or (rows and len(embedding) != len(rows[0])):
+                continue
+            created_at = data.get('createdAt')
+            rows.append(list(embedding))
+            contents.append(content)
+            timestamps.append(data.get('timestamp') or '')
+            created.append(created_at.timestamp() if hasattr(created_at, 'timestamp') else time.time())
+        matrix = np.asarray(rows, dtype=np.float32)
+        return _UserMemories(
+            matrix=_unit_rows(matrix) if rows else np.zeros((0, 0), dtype=np.float32),
+            contents=contents,
+            timestamps=timestamps,
+            created=np.asarray(created, dtype=np.float64),
+            complete=True,
+            loaded_at=time.time(),
+        )
+
+    def _rank(self, memories: _UserMemories, vector: List[float], limit: int) -> List[MemoryEntry]:
+        query = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        count = memories.matrix.shape[0]
+        if not count or norm == 0 or limit <= 0:
+            return []
+        half_life = (config.MEMORY_RECENCY_HALF_LIFE_DAYS or 30.0) * 86400
+        ages = np.maximum(0.0, time.time() - memories.created)
+        recency = np.power(0.5, ages / half_life)
+        scores = memories.matrix @ (query / norm) + (config.MEMORY_RECENCY_WEIGHT or 0.0) * recency
+        size = min(limit, count)
+        top = np.argpartition(-scores, size - 1)[:size]
+        top = top[np.argsort(-scores[top])]
+        return [_memory_entry(memories.contents[row], memories.timestamps[row]) for row in top]
 
     async def search_memory(self, *, app_name: str, user_id: str, query: str) -> SearchMemoryResponse:
         query = query.strip()
@@ -68,45 +344,60 @@ class FirestoreMemoryService(BaseMemoryService):
             return SearchMemoryResponse(memories=[])
 
         scope = _scope_key(app_name, user_id)
-        cache_key = f"{scope}:{query.lower()}"
-        cached = self._cache.get(cache_key)
-        if cached:
-            return cached
+        generation = await self._generation(scope)
+        cache_key = f"{scope}:{generation}:{query.lower()}"
+        response = await self._cache.aget_or_load(cache_key, lambda: self._query_memories(scope, query, generation))
+        return response or SearchMemoryResponse(memories=[])
 
+    async def _query_memories(self, scope: str, query: str, generation: str) -> Optional[SearchMemoryResponse]:
         try:
-            vector = generate_embedding(query, 'RETRIEVAL_QUERY')
-            base_query = self._db.collection('memories').where(
-                filter=FieldFilter('scopeKey', '==', scope)
-            )
-            vector_query = base_query.find_nearest(
-                'embedding',
-                vector,
-                limit=config.MEMORY_SEARCH_LIMIT or 5,
-                distance_measure=DistanceMeasure.COSINE,
-                distance_result_field='_distance',
-            )
-            snapshot = vector_query.get()
-
-            memories = []
-            for doc in snapshot:
-                data = doc.to_dict() or {}
-                content = data.get('content', '')
-                if not content:
-                    continue
-                memories.append(
-                    MemoryEntry(
-                        content={
-                            'role': 'assistant',
-                            'parts': [{'text': content}],
-                        },
-                        author='memory',
-                        timestamp=data.get('timestamp') or '',
-                    )
-                )
+            # Keyed by generation too: other instances' semantic caches are not invalidated on write.
+            namespace = f'{scope}:{generation}'
+            vector = await asyncio.to_thread(generate_embedding, query, 'RETRIEVAL_QUERY')
+            if config.SEMANTIC_CACHE_ENABLED:
+                similar = self._semantic_cache.lookup(namespace, vector)
+                if similar is not None:
+                    return similar
+
+            limit = config.MEMORY_SEARCH_LIMIT or 5
+            memories = None
+            if config.MEMORY_MATRIX_ENABLED:
+                user_memories = await self._matrices.aget_or_load(scope, lambda: self._load_user_memories(scope))
+                if (
+                    user_memories is not None
+                    and user_memories.complete
+                    and (not user_memories.matrix.shape[0] or user_memories.matrix.shape[1] == len(vector))
+                ):
+                    memories = self._rank(user_memories, vector, limit)
+            if memories is None:
+                memories = await self._find_nearest(scope, vector, limit)
 
             response = SearchMemoryResponse(memories=memories)
-            self._cache.set(cache_key, response)
+            if config.SEMANTIC_CACHE_ENABLED:
+                self._semantic_cache.store(namespace, vector, response)
             return response
         except Exception as exc:  # pragma: no cover - network/runtime dependent
             print(f'[Memory] search failed: {exc}')
-            return SearchMemoryResponse(memories=[])
+            return None
+
+    async def _find_nearest(self, scope: str, vector: List[float], limit: int) -> List[MemoryEntry]:
+        base_query = get_async_client().collection('memories').where(
+            filter=FieldFilter('scopeKey', '==', scope)
+        )
+        vector_query = base_query.find_nearest(
+            'embedding',
+            vector,
+            limit=limit,
+            distance_measure=DistanceMeasure.COSINE,
+            distance_result_field='_distance',
+        )
+        snapshot = await vector_query.get()
+
+        memories = []
+        for doc in snapshot:
+            data = doc.to_dict() or {}
+            content = data.get('content', '')
+            if not content:
+                continue
+            memories.append(_memory_entry(content, data.get('timestamp') or ''))
+        return memories
@@ -1,9 +1,41 @@
-"""Firestore-backed session service for ADK."""
+"""Firestore-backed session service for ADK.
+
+Each session is a header document in ``sessions`` (ids, state, timestamps) plus
+an append-only ``events`` subcollection with one document per event. Events
+older than the header's ``eventsFrom`` timestamp have been summarized away.
+Event documents hold a versioned msgpack payload (see ``event_codec``) that is
+only decoded when the event is first accessed.
+
+The TypeScript session service still keeps a session's events in an ``events``
+array on the header. While ``SESSION_LEGACY_EVENTS_ARRAY`` is on, that array is
+read as the event source and rewritten with the capped window on every append,
+alongside the subcollection; once it is off, an array found on a header is
+migrated into the subcollection and removed.
+
+Summarization runs on the background queue: ``append_event`` only schedules it,
+the summary is merged into the header in a transaction, and the result is
+applied to the live session on its next appended event.
+
+State changes are written behind: ``update_session`` only buffers, and the
+buffered state goes out as field-path updates of the changed keys, together
+with the next appended event or on ``flush_state`` at the end of the run.
+
+Sessions read or written by this instance are cached together with the header's
+``update_time``; ``get_session`` then only reads a field-masked probe of the
+header and reuses the cached events while the document is unchanged.
+"""
 
 from __future__ import annotations
 
+import asyncio
+import base64
+import copy
+import json
+import threading
 import time
-from typing import Any, Optional
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
 
 import firebase_admin
 from firebase_admin import firestore
@@ -11,8 +43,15 @@ from google.adk.events import Event
 from google.adk.sessions.base_session_service import BaseSessionService, GetSessionConfig, ListSessionsResponse
 from google.adk.sessions.session import Session
 from google.cloud.firestore_v1 import FieldFilter
+from google.cloud.firestore_v1.async_transaction import async_transactional
+from google.cloud.firestore_v1.field_path import FieldPath
+
 from . import config
-from .genai_client import summarize_conversation
+from .background import background_queue
+from .cache import TtlCache
+from .event_codec import EncodedEvent, LazyEventList, encode_event
+from .firestore_client import get_async_client
+from .genai_client import event_token_estimate, summarize_conversation
 
 SUMMARY_SKIP_AUTHORS = {
     'signals_research_agent',
@@ -32,13 +71,102 @@ def _ensure_firebase() -> None:
 
 
 def _serialize_event(event: Event) -> dict[str, Any]:
-    return event.model_dump(by_alias=True, mode='json', exclude_none=True)
+    return encode_event(event, encoding=config.SESSION_EVENT_ENCODING)
 
 
 def _deserialize_event(raw: dict[str, Any]) -> Event:
     return Event.model_validate(raw)
 
 
+def _legacy_event_doc(event: Event) -> dict[str, Any]:
+    return event.model_dump(by_alias=True, mode='json', exclude_none=True)
+
+
+_BATCH_LIMIT = 400
+
+
+def _event_doc_id(event: Event) -> str:
+    # Zero-padded milliseconds keep document ids in append order.
+    return f"{int(event.timestamp * 1000):013d}_{event.id}"
+
+
+def _events_after(events: list[Event], timestamp: float, *, inclusive: bool = False) -> list[Event]:
+    if isinstance(events, LazyEventList):
+        return events.after(timestamp, inclusive=inclusive)
+    if inclusive:
+        return [e for e in events if e.timestamp >= timestamp]
+    return [e for e in events if e.timestamp > timestamp]
+
+
+def _session_event_limit() -> Optional[int]:
+    # ``get_session`` takes a parameter named ``config`` that shadows the module.
+    return config.SESSION_EVENT_LIMIT
+
+
+def _legacy_events_array() -> bool:
+    return config.SESSION_LEGACY_EVENTS_ARRAY
+
+
+def _array_events(
+    raw_events: list[Any],
+    *,
+    events_from: Optional[float],
+    after_timestamp: Optional[float],
+    limit: Optional[int],
+) -> list[Event]:
+    events = [_deserialize_event(e) for e in raw_events if isinstance(e, dict)]
+    if events_from is not None:
+        events = _events_after(events, events_from, inclusive=True)
+    if after_timestamp is not None:
+        events = _events_after(events, after_timestamp)
+    return events[-limit:] if limit else events
+
+
+_MAX_LIST_PAGE_SIZE = 200
+
+
+class SessionPage(ListSessionsResponse):
+    next_page_token: Optional[str] = None
+
+
+def _encode_page_token(last_update_time: datetime, doc_id: str) -> str:
+    raw = json.dumps([last_update_time.isoformat(), doc_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def _decode_page_token(token: str) -> Optional[Tuple[datetime, str]]:
+    try:
+        stamp, doc_id = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return datetime.fromisoformat(stamp), str(doc_id)
+    except (ValueError, TypeError):
+        return None
+
+
+@dataclass
+class _CachedSession:
+    update_time: Any
+    session: Session
+
+
+@dataclass
+class _SummaryResult:
+    summary: str
+    event_count: int
+    events_from: float
+
+
+def _copy_session(session: Session) -> Session:
+    # Events are not mutated once appended, so sharing them is safe; the list and state are copied.
+    return Session.model_construct(
+        id=session.id,
+        app_name=session.app_name,
+        user_id=session.user_id,
+        state=copy.deepcopy(session.state),
+        events=session.events.copy() if isinstance(session.events, LazyEventList) else list(session.events),
+        last_update_time=session.last_update_time,
+    )
+
+
 def _get_timestamp_value(value: Any) -> float:
     if value is None:
         return time.time()
@@ -52,7 +180,39 @@ def _get_timestamp_value(value: Any) -> float:
 class FirestoreSessionService(BaseSessionService):
     def __init__(self) -> None:
         _ensure_firebase()
-        self._db = firestore.client()
+        self._lock = threading.Lock()
+        self._pending_states: Dict[str, dict[str, Any]] = {}
+        # Summaries merged by the background queue, waiting to be applied to the live session.
+        self._summaries: Dict[str, _SummaryResult] = {}
+        # Last state known to be stored per session; field-path diffs are taken against it.
+        self._persisted_states = TtlCache[dict[str, Any]](max_size=1000, ttl_seconds=3600, name='session-state')
+        self._sessions = TtlCache[_CachedSession](
+            max_size=config.SESSION_CACHE_MAX or 200,
+            ttl_seconds=config.SESSION_CACHE_TTL_SECONDS or 1800,
+            name='sessions',
+        )
+
+    def _cache_session(self, session: Session, update_time: Any) -> None:
+        if update_time is None:
+            self._sessions.delete(session.id)
+            return
+        self._sessions.set(session.id, _CachedSession(update_time=update_time, session=_copy_session(session)))
+
+    def _remember_state(self, session_id: str, state: dict[str, Any]) -> None:
+        self._persisted_states.set(session_id, copy.deepcopy(state))
+
+    def _state_updates(self, session_id: str, state: dict[str, Any]) -> dict[str, Any]:
+        previous = self._persisted_states.get(session_id)
+        if previous is None:
+            return {'state': state}
+        updates: dict[str, Any] = {}
+        for key, value in state.items():
+            if key not in previous or previous[key] != value:
+                updates[FieldPath('state', key).to_api_repr()] = value
+        for key in previous:
+            if key not in state:
+                updates[FieldPath('state', key).to_api_repr()] = firestore.DELETE_FIELD
+        return updates
 
     async def create_session(
         self,
@@ -73,10 +233,49 @@ class FirestoreSessionService(BaseSessionService):
         )
 
         doc = session.model_dump(by_alias=True, mode='json', exclude_none=True)
+        doc.pop('events', None)
         doc['lastUpdateTime'] = firestore.SERVER_TIMESTAMP
-        self._db.collection('sessions').document(session_id).set(doc)
+        doc['eventCount'] = 0
+        if config.SESSION_LEGACY_EVENTS_ARRAY:
+            doc['events'] = []
+        result = await self._session_ref(session_id).set(doc)
+        self._remember_state(session_id, session.state)
+        self._cache_session(session, getattr(result, 'update_time', None))
         return session
 
+    def _session_ref(self, session_id: str):
+        return get_async_client().collection('sessions').document(session_id)
+
+    async def _migrate_legacy_events(self, doc_ref, raw_events: list[Any]) -> None:
+        """Moves a pre-subcollection ``events`` array into the events subcollection."""
+        events = [_deserialize_event(e) for e in raw_events if isinstance(e, dict)]
+        for start in range(0, len(events), _BATCH_LIMIT):
+            batch = get_async_client().batch()
+            for event in events[start : start + _BATCH_LIMIT]:
+                batch.set(doc_ref.collection('events').document(_event_doc_id(event)), _serialize_event(event))
+            await batch.commit()
+        await doc_ref.update({'events': firestore.DELETE_FIELD, 'eventCount': len(events)})
+
+    async def _load_events(
+        self,
+        doc_ref,
+        *,
+        events_from: Optional[float],
+        after_timestamp: Optional[float],
+        limit: Optional[int],
+    ) -> list[Event]:
+        query = doc_ref.collection('events')
+        if after_timestamp is not None and (events_from is None or after_timestamp >= events_from):
+            query = query.where(filter=FieldFilter('timestamp', '>', after_timestamp))
+        elif events_from is not None:
+            query = query.where(filter=FieldFilter('timestamp', '>=', events_from))
+        query = query.order_by('timestamp', direction=firestore.Query.DESCENDING)
+        if limit:
+            query = query.limit(limit)
+        events = LazyEventList([EncodedEvent(doc.to_dict() or {}) async for doc in query.stream()])
+        events.reverse()
+        return events
+
     async def get_session(
         self,
         *,
@@ -85,19 +284,58 @@ class FirestoreSessionService(BaseSessionService):
         session_id: str,
         config: Optional[GetSessionConfig] = None,
     ) -> Optional[Session]:
-        doc_ref = self._db.collection('sessions').document(session_id)
-        snapshot = doc_ref.get()
+        doc_ref = self._session_ref(session_id)
+        cached = self._sessions.get(session_id)
+        if cached is not None:
+            probe = await doc_ref.get(field_paths=['appName', 'userId'])
+            if not probe.exists:
+                self._sessions.delete(session_id)
+                return None
+            if probe.update_time == cached.update_time:
+                probe_data = probe.to_dict() or {}
+                if probe_data.get('userId') != user_id or probe_data.get('appName') != app_name:
+                    return None
+                session = _copy_session(cached.session)
+                if config:
+                    if config.after_timestamp is not None:
+                        session.events = _events_after(session.events, config.after_timestamp)
+                    if config.num_recent_events:
+                        session.events = session.events[-config.num_recent_events :]
+                return session
+
+        snapshot = await doc_ref.get()
         if not snapshot.exists:
             return None
         data = snapshot.to_dict() or {}
         if data.get('userId') != user_id or data.get('appName') != app_name:
             return None
 
-        raw_events = data.get('events') or []
-        events = [_deserialize_event(e) for e in raw_events if isinstance(e, dict)]
+        update_time = snapshot.update_time
+        raw_events = data.get('events')
+        limit = config.num_recent_events if config and config.num_recent_events else _session_event_limit()
+        after_timestamp = config.after_timestamp if config else None
+        if isinstance(raw_events, list) and _legacy_events_array():
+            events = _array_events(
+                raw_events,
+                events_from=data.get('eventsFrom'),
+                after_timestamp=after_timestamp,
+                limit=limit,
+            )
+        else:
+            if isinstance(raw_events, list):
+                await self._migrate_legacy_events(doc_ref, raw_events)
+                update_time = None
+            events = await self._load_events(
+                doc_ref,
+                events_from=data.get('eventsFrom'),
+                after_timestamp=after_timestamp,
+                limit=limit,
+            )
         last_update = _get_timestamp_value(data.get('lastUpdateTime'))
+        self._remember_state(session_id, data.get('state') or {})
 
-        session = Session(
+        # model_construct keeps the lazy event list as-is instead of validating every event.
+        session = Session.model_construct(
             id=data.get('id', session_id),
             app_name=data.get('appName', app_name),
             user_id=data.get('userId', user_id),
@@ -106,24 +344,43 @@ class FirestoreSessionService(BaseSessionService):
             last_update_time=last_update,
         )
 
-        if config:
-            if config.after_timestamp is not None:
-                session.events = [e for e in session.events if e.timestamp > config.after_timestamp]
-            if config.num_recent_events:
-                session.events = session.events[-config.num_recent_events :]
-
+        if not config:
+            self._cache_session(session, update_time)
         return session
 
-    async def list_sessions(self, *, app_name: str, user_id: Optional[str] = None) -> ListSessionsResponse:
-        query = self._db.collection('sessions').where(
-            filter=FieldFilter('appName', '==', app_name)
-        )
+    async def list_sessions(
+        self,
+        *,
+        app_name: str,
+        user_id: Optional[str] = None,
+        page_size: Optional[int] = None,
+        page_token: Optional[str] = None,
+    ) -> SessionPage:
+        """One page of session shells, most recently updated first.
+
+        Only the header fields needed for the shells are read. Pass the returned
+        ``next_page_token`` as ``page_token`` to continue; it is None on the last page.
+        """
+        collection = get_async_client().collection('sessions')
+        query = collection.where(filter=FieldFilter('appName', '==', app_name))
         if user_id:
             query = query.where(filter=FieldFilter('userId', '==', user_id))
+        # The document id breaks ties, so the token's (lastUpdateTime, id) pair is a stable
+        # position even if that session is updated or deleted before the next page.
         query = query.order_by('lastUpdateTime', direction=firestore.Query.DESCENDING)
+        query = query.order_by(FieldPath.document_id(), direction=firestore.Query.DESCENDING)
+        query = query.select(['id', 'appName', 'userId', 'lastUpdateTime'])
+        if page_token:
+            cursor = _decode_page_token(page_token)
+            if cursor is None:
+                return SessionPage(sessions=[])
+            query = query.start_after({'lastUpdateTime': cursor[0], FieldPath.document_id(): collection.document(cursor[1])})
+        size = max(1, min(page_size or config.SESSION_LIST_PAGE_SIZE or 50, _MAX_LIST_PAGE_SIZE))
+        query = query.limit(size + 1)
 
         sessions = []
-        for doc in query.stream():
+        docs = [doc async for doc in query.stream()]
+        for doc in docs[:size]:
             data = doc.to_dict() or {}
             sessions.append(
                 Session(
@@ -135,16 +392,30 @@ class FirestoreSessionService(BaseSessionService):
                     last_update_time=_get_timestamp_value(data.get('lastUpdateTime')),
                 )
             )
-        return ListSessionsResponse(sessions=sessions)
+        next_page_token = None
+        if len(docs) > size:
+            last = docs[size - 1]
+            next_page_token = _encode_page_token((last.to_dict() or {})['lastUpdateTime'], last.id)
+        return SessionPage(sessions=sessions, next_page_token=next_page_token)
 
     async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
-        doc_ref = self._db.collection('sessions').document(session_id)
-        snapshot = doc_ref.get()
+        doc_ref = self._session_ref(session_id)
+        snapshot = await doc_ref.get()
         if not snapshot.exists:
             return
         data = snapshot.to_dict() or {}
-        if data.get('appName') == app_name and data.get('userId') == user_id:
-            doc_ref.delete()
+        if data.get('appName') != app_name or data.get('userId') != user_id:
+            return
+        self._sessions.delete(session_id)
+        while True:
+            docs = [doc async for doc in doc_ref.collection('events').limit(_BATCH_LIMIT).stream()]
+            if not docs:
+                break
+            batch = get_async_client().batch()
+            for doc in docs:
+                batch.delete(doc.reference)
+            await batch.commit()
+        await doc_ref.delete()
 
     async def append_event(self, session: Session, event: Event) -> Event:
         event = await super().append_event(session, event)
@@ -152,27 +423,58 @@ class FirestoreSessionService(BaseSessionService):
             return event
 
         session.last_update_time = time.time()
-        await self._maybe_summarize_session(session, event)
+        self._apply_summary(session)
+        self._maybe_summarize_session(session, event)
 
         if config.SESSION_EVENT_LIMIT and len(session.events) > config.SESSION_EVENT_LIMIT:
             session.events = session.events[-config.SESSION_EVENT_LIMIT :]
 
-        serialized_events = [_serialize_event(e) for e in session.events]
-        self._db.collection('sessions').document(session.id).update({
-            'events': serialized_events,
+        doc_ref = self._session_ref(session.id)
+        with self._lock:
+            self._pending_states.pop(session.id, None)
+        state = session.state or {}
+        header: dict[str, Any] = {
+            **self._state_updates(session.id, state),
             'lastUpdateTime': firestore.SERVER_TIMESTAMP,
-            'state': session.state or {},
-        })
+            'eventCount': firestore.Increment(1),
+        }
+        if config.SESSION_LEGACY_EVENTS_ARRAY:
+            header['events'] = [_legacy_event_doc(e) for e in session.events]
+
+        batch = get_async_client().batch()
+        batch.set(doc_ref.collection('events').document(_event_doc_id(event)), _serialize_event(event))
+        batch.update(doc_ref, header)
+        results = await batch.commit()
+        self._remember_state(session.id, state)
+        self._cache_session(session, results[-1].update_time if results else None)
 
         return event
 
     async def update_session(self, *, app_name: str, user_id: str, session_id: str, state: dict[str, Any]) -> None:
-        self._db.collection('sessions').document(session_id).update({
-            'state': state,
+        """Buffers ``state``; it is written with the next event or by ``flush_state``."""
+        with self._lock:
+            self._pending_states[session_id] = state
+
+    async def flush_state(self, session_id: str) -> None:
+        """Writes buffered state for ``session_id`` as one field-path update of the changed keys."""
+        with self._lock:
+            state = self._pending_states.pop(session_id, None)
+        if state is None:
+            return
+        updates = self._state_updates(session_id, state)
+        if not updates:
+            return
+        result = await self._session_ref(session_id).update({
+            **updates,
             'lastUpdateTime': firestore.SERVER_TIMESTAMP,
         })
+        self._remember_state(session_id, state)
+        cached = self._sessions.get(session_id)
+        if cached is not None:
+            cached.session.state = copy.deepcopy(state)
+            self._sessions.set(session_id, _CachedSession(update_time=result.update_time, session=cached.session))
 
-    async def _maybe_summarize_session(self, session: Session, event: Event) -> None:
+    def _maybe_summarize_session(self, session: Session, event: Event) -> None:
         if not event.author or event.author == 'user':
             return
         if event.author in SUMMARY_SKIP_AUTHORS:
@@ -184,28 +486,105 @@ class FirestoreSessionService(BaseSessionService):
         keep = config.SESSION_SUMMARY_KEEP or 12
         cooldown = config.SESSION_SUMMARY_COOLDOWN or 20
 
-        if trigger <= 0 or keep <= 0 or len(session.events) <= trigger:
+        if trigger <= 0 or keep <= 0:
             return
 
-        last_count_raw = session.state.get(config.SUMMARY_EVENT_COUNT_KEY, 0)
-        try:
-            last_count = int(last_count_raw)
-        except (TypeError, ValueError):
-            last_count = 0
-
-        if len(session.events) < last_count + cooldown:
+        # The cooldown counts events not yet summarized (at or after the summary
+        # offset), not the list length: applying a summary trims the list and
+        # append_event caps it, so an absolute count would never be reached again.
+        # Only those events are sent, capped by the token budget; whatever does not
+        # fit stays pending and counts toward the next pass.
+        cut = len(session.events) - keep
+        offset = session.state.get(config.SUMMARY_OFFSET_KEY)
+        start = 0
+        if isinstance(offset, (int, float)):
+            while start < cut and session.events[start].timestamp < offset:
+                start += 1
+            if cut - start < cooldown:
+                return
+        elif len(session.events) <= trigger:
+            return
+        budget = config.SESSION_SUMMARY_TOKEN_BUDGET or 4000
+        end = start
+        used = 0
+        while end < cut:
+            cost = event_token_estimate(session.events[end])
+            if end > start and used + cost > budget:
+                break
+            used += cost
+            end += 1
+        if end == start:
             return
 
-        summary_events = session.events[: max(0, len(session.events) - keep)]
+        summary_events = session.events[start:end]
         existing_summary = session.state.get(config.SUMMARY_STATE_KEY, '')
+        existing_summary = existing_summary if isinstance(existing_summary, str) else ''
+        events_from = session.events[end].timestamp
+        event_count = len(session.events)
+        session_id = session.id
+
+        background_queue.submit(
+            f'summary:{session_id}',
+            lambda: self._summarize(session_id, summary_events, existing_summary, events_from, event_count),
+        )
 
-        summary = summarize_conversation(summary_events, existing_summary if isinstance(existing_summary, str) else None)
+    async def _summarize(
+        self,
+        session_id: str,
+        summary_events: list[Event],
+        existing_summary: str,
+        events_from: float,
+        event_count: int,
+    ) -> None:
+        summary = await asyncio.to_thread(summarize_conversation, summary_events, existing_summary or None)
         if not summary:
             return
-
-        session.state = {
-            **session.state,
-            config.SUMMARY_STATE_KEY: summary,
-            config.SUMMARY_EVENT_COUNT_KEY: len(session.events),
+        result = _SummaryResult(summary=summary, event_count=event_count, events_from=events_from)
+        if await self._merge_summary(session_id, existing_summary, result):
+            with self._lock:
+                self._summaries[session_id] = result
+
+    async def _merge_summary(self, session_id: str, existing_summary: str, result: _SummaryResult) -> bool:
+        """Writes ``result`` unless the header moved past the version it was computed from.
+
+        The summary is built on ``existing_summary`` and covers events before
+        ``events_from``; if another pass already advanced ``eventsFrom`` or replaced
+        the summary, this one is dropped so each session version is merged at most once.
+        """
+        doc_ref = self._session_ref(session_id)
+
+        @async_transactional
+        async def merge(transaction) -> bool:
+            snapshot = await doc_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return False
+            data = snapshot.to_dict() or {}
+            stored_summary = (data.get('state') or {}).get(config.SUMMARY_STATE_KEY) or ''
+            if (data.get('eventsFrom') or 0) >= result.events_from or stored_summary != existing_summary:
+                return False
+            transaction.update(doc_ref, {
+                FieldPath('state', config.SUMMARY_STATE_KEY).to_api_repr(): result.summary,
+                FieldPath('state', config.SUMMARY_EVENT_COUNT_KEY).to_api_repr(): result.event_count,
+                FieldPath('state', config.SUMMARY_OFFSET_KEY).to_api_repr(): result.events_from,
+                'eventsFrom': result.events_from,
+                'lastUpdateTime': firestore.SERVER_TIMESTAMP,
+            })
+            return True
+
+        return await merge(get_async_client().transaction())
+
+    def _apply_summary(self, session: Session) -> None:
+        with self._lock:
+            result = self._summaries.pop(session.id, None)
+        if result is None:
+            return
+        summary_state = {
+            config.SUMMARY_STATE_KEY: result.summary,
+            config.SUMMARY_EVENT_COUNT_KEY: result.event_count,
+            config.SUMMARY_OFFSET_KEY: result.events_from,
         }
-        session.events = session.events[-keep:]
+        session.state = {**session.state, **summary_state}
+        session.events = _events_after(session.events, result.events_from, inclusive=True)
+        previous = self._persisted_states.get(session.id)
+        if previous is not None:
+            self._remember_state(session.id, {**previous, **summary_state})
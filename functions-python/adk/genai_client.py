@@ -2,18 +2,30 @@
 
 from __future__ import annotations
 
-import math
+import hashlib
 import os
-from typing import Iterable, List, Optional
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
 
+import numpy as np
 from google import genai
 from google.genai import types
 
 from . import config
+from .cache import TtlCache
+from .cache_backends import get_shared_backend
 
 _client: Optional[genai.Client] = None
 _cached_safety_settings: Optional[List[types.SafetySetting]] = None
 _warned_thinking_conflict = False
+_embedding_cache = TtlCache[np.ndarray](
+    max_size=config.EMBEDDING_CACHE_MAX or 2000,
+    ttl_seconds=config.EMBEDDING_CACHE_TTL_SECONDS or 604800,
+    name='embedding',
+    backend=get_shared_backend() if config.EMBEDDING_CACHE_PERSIST else None,
+    promote=True,
+)
 
 
 def get_genai_client() -> genai.Client:
@@ -95,15 +107,40 @@ def get_temperature_for_model(model_name: str, fallback: float) -> float:
     return config.GENAI_TEMPERATURE if config.GENAI_TEMPERATURE is not None else fallback
 
 
-def _normalize_embedding(values: Iterable[float]) -> List[float]:
-    vector = [float(v) for v in values]
-    norm = math.sqrt(sum(v * v for v in vector))
-    if norm == 0:
-        return vector
-    return [v / norm for v in vector]
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return np.divide(matrix, norms, out=np.array(matrix, dtype=np.float32), where=norms > 0)
+
+
+def _normalize_text(text: str) -> str:
+    return unicodedata.normalize('NFC', ' '.join((text or '').split()))
+
+
+def embedding_cache_key(text: str, task_type: str) -> str:
+    # Whitespace and Unicode form only affect the key; the model always embeds the text as given.
+    raw = '\x00'.join([
+        config.EMBEDDING_MODEL,
+        task_type,
+        str(config.EMBEDDING_DIMENSION or ''),
+        _normalize_text(text),
+    ])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def generate_embedding_array(text: str, task_type: str) -> np.ndarray:
+    """Unit-normalized float32 embedding, served from the embedding cache when possible."""
+    vector = _embedding_cache.get_or_load(
+        embedding_cache_key(text, task_type),
+        lambda: _embed_content(text, task_type),
+    )
+    return vector if vector is not None else np.empty(0, dtype=np.float32)
 
 
 def generate_embedding(text: str, task_type: str) -> List[float]:
+    return generate_embedding_array(text, task_type).tolist()
+
+
+def _embed_batch(texts: List[str], task_type: str) -> List[Optional[np.ndarray]]:
     client = get_genai_client()
     embed_config = types.EmbedContentConfig(
         task_type=task_type,
@@ -111,11 +148,63 @@ def generate_embedding(text: str, task_type: str) -> List[float]:
     )
     response = client.models.embed_content(
         model=config.EMBEDDING_MODEL,
-        contents=text,
+        contents=texts,
         config=embed_config,
     )
-    values = response.embeddings[0].values if response.embeddings else []
-    return _normalize_embedding(values)
+    embeddings = list(response.embeddings or [])
+    if len(embeddings) != len(texts) or not all(item.values for item in embeddings):
+        # Never guess the alignment of a partial response; missing rows are simply not cached.
+        return [None] * len(texts)
+
+    matrix = _normalize_rows(np.asarray([item.values for item in embeddings], dtype=np.float32))
+    matrix.setflags(write=False)
+    return list(matrix)
+
+
+def _embed_content(text: str, task_type: str) -> Optional[np.ndarray]:
+    return _embed_batch([text], task_type)[0]
+
+
+def generate_embeddings(texts: Sequence[str], task_type: str) -> np.ndarray:
+    """Embeds ``texts`` in batched model calls; returns a C-contiguous float32 matrix, one row per text.
+
+    Cached texts are not re-sent, and texts sharing a cache key are embedded once,
+    from the first of them. Rows the model returned nothing for are zeros.
+    """
+    keys = [embedding_cache_key(text, task_type) for text in texts]
+    vectors: Dict[str, Optional[np.ndarray]] = {}
+    pending: List[Tuple[str, str]] = []
+    for key, text in zip(keys, texts):
+        if key in vectors:
+            continue
+        vectors[key] = _embedding_cache.get(key)
+        if vectors[key] is None and text.strip():
+            pending.append((key, text))
+
+    batch_size = max(1, config.EMBEDDING_BATCH_SIZE or 100)
+    batches = [pending[i : i + batch_size] for i in range(0, len(pending), batch_size)]
+    if batches:
+        workers = max(1, min(config.EMBEDDING_BATCH_CONCURRENCY or 4, len(batches)))
+        if workers == 1:
+            results = [_embed_batch([text for _, text in batch], task_type) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(lambda batch: _embed_batch([text for _, text in batch], task_type), batches))
+        for batch, batch_vectors in zip(batches, results):
+            for (key, _), vector in zip(batch, batch_vectors):
+                vectors[key] = vector
+                if vector is not None:
+                    _embedding_cache.set(key, vector)
+
+    dimension = next((vector.shape[0] for vector in vectors.values() if vector is not None), 0)
+    if not dimension:
+        dimension = config.EMBEDDING_DIMENSION or 0
+    matrix = np.zeros((len(keys), dimension), dtype=np.float32)
+    for row, key in enumerate(keys):
+        vector = vectors.get(key)
+        if vector is not None and vector.shape[0] == dimension:
+            matrix[row] = vector
+    return matrix
 
 
 def _extract_event_text(event) -> str:
@@ -127,6 +216,11 @@ def _extract_event_text(event) -> str:
     return f"{author.upper()}: {text.strip()}"
 
 
+def event_token_estimate(event) -> int:
+    """Rough prompt cost of ``event`` in tokens (about four characters per token)."""
+    return (len(_extract_event_text(event)) + 3) // 4 if event.content and event.content.parts else 0
+
+
 def summarize_conversation(events, existing_summary: str | None = None) -> str:
     lines = [
         _extract_event_text(event)
@@ -144,8 +238,14 @@ def summarize_conversation(events, existing_summary: str | None = None) -> str:
         'Be concise and factual. Use short bullet points.',
     ]
     if existing_summary:
+        prompt_parts.append(
+            'Update the existing summary with the new conversation below. Keep earlier facts '
+            'unless the new conversation supersedes them, and return the full updated summary.'
+        )
         prompt_parts.append(f"Existing summary:\n{existing_summary}")
-    prompt_parts.append('Conversation:')
+        prompt_parts.append('New conversation:')
+    else:
+        prompt_parts.append('Conversation:')
     prompt_parts.append('\n'.join(lines))
 
     prompt = '\n\n'.join(prompt_parts)
@@ -164,3 +264,33 @@ def summarize_conversation(events, existing_summary: str | None = None) -> str:
     if callable(text):
         text = text()
     return (text or '').strip()
+
+
+def merge_memories(contents: Sequence[str]) -> str:
+    """Combines overlapping memory summaries into one, keeping the newest facts when they conflict."""
+    items = [content.strip() for content in contents if content and content.strip()]
+    if len(items) <= 1:
+        return items[0] if items else ''
+
+    prompt = '\n\n'.join([
+        'Merge these notes about the same user into one concise summary for future context.',
+        'Keep every distinct fact (goals, risk tolerance, time horizon, assets, decisions, constraints). '
+        'Notes are oldest first; when they conflict, keep the newest. Use short bullet points.',
+        'Notes:',
+        '\n---\n'.join(items),
+    ])
+
+    client = get_genai_client()
+    response = client.models.generate_content(
+        model=config.MODEL_FLASH,
+        contents=prompt,
+        config=types.GenerateContentConfig(
+            safety_settings=get_safety_settings(),
+            temperature=get_temperature_for_model(config.MODEL_FLASH, 0.2),
+        ),
+    )
+
+    text = response.text if hasattr(response, 'text') else ''
+    if callable(text):
+        text = text()
+    return (text or '').strip()
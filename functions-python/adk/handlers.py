@@ -3,16 +3,15 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Dict, Iterable, List, Optional
-
-import asyncio
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
 
 from firebase_functions import https_fn, options
-from flask import stream_with_context
 from google.adk.events import Event
 from google.genai import types
 
-from .runner import trade_sync_runner, get_or_create_session
+from .background import event_loop
+from .maintenance import run_maintenance
+from .runner import session_service, trade_sync_runner, get_or_create_session
 
 
 def _format_history(history: List[Dict[str, str]]) -> str:
@@ -105,28 +104,66 @@ def _iter_event_text(event: Event) -> Iterable[str]:
     ]
 
 
-def _collect_agent_text(user_id: str, session_id: str, prompt: str) -> tuple[str, List[Dict[str, Any]], List[str]]:
+async def _collect_agent_text(user_id: str, session_id: str, prompt: str) -> tuple[str, List[Dict[str, Any]], List[str]]:
     text = ''
     sources: List[Dict[str, Any]] = []
     errors: List[str] = []
-    for event in trade_sync_runner.run(
-        user_id=user_id,
-        session_id=session_id,
-        new_message=types.Content(role='user', parts=[types.Part(text=prompt)]),
-    ):
-        for chunk in _iter_event_text(event):
-            text += chunk
-        error_message = _event_error(event)
-        if error_message:
-            errors.append(error_message)
-        for response in event.get_function_responses():
-            sources.extend(_extract_sources_from_response(response))
+    try:
+        async for event in trade_sync_runner.run_async(
+            user_id=user_id,
+            session_id=session_id,
+            new_message=types.Content(role='user', parts=[types.Part(text=prompt)]),
+        ):
+            for chunk in _iter_event_text(event):
+                text += chunk
+            error_message = _event_error(event)
+            if error_message:
+                errors.append(error_message)
+            for response in event.get_function_responses():
+                sources.extend(_extract_sources_from_response(response))
+    finally:
+        # after_run_callback also flushes buffered state, but it is skipped when the run raises.
+        await session_service.flush_state(session_id)
     return text, _dedupe_sources(sources), errors
 
 
+async def _stream_agent_events(user_id: str, session_id: str, prompt: str) -> AsyncIterator[str]:
+    sources: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    try:
+        async for event in trade_sync_runner.run_async(
+            user_id=user_id,
+            session_id=session_id,
+            new_message=types.Content(role='user', parts=[types.Part(text=prompt)]),
+        ):
+            for chunk in _iter_event_text(event):
+                yield f"event: text\ndata: {json.dumps(chunk)}\n\n"
+            error_message = _event_error(event)
+            if error_message:
+                errors.append(error_message)
+                yield f"event: error\ndata: {json.dumps(error_message)}\n\n"
+            if event.content and event.content.parts:
+                for part in event.content.parts:
+                    if part.function_call:
+                        yield f"event: function_call\ndata: {json.dumps({'name': part.function_call.name, 'args': part.function_call.args})}\n\n"
+
+            for response in event.get_function_responses():
+                sources.extend(_extract_sources_from_response(response))
+    finally:
+        # after_run_callback also flushes buffered state, but it is skipped when the run raises.
+        await session_service.flush_state(session_id)
+
+    if errors and not sources:
+        yield f"event: error\ndata: {json.dumps('Model request failed. Check server logs for details.')}\n\n"
+    yield f"event: sources\ndata: {json.dumps(_dedupe_sources(sources))}\n\n"
+    yield "event: done\ndata: {}\n\n"
+
+
 @https_fn.on_request(
     cors=options.CorsOptions(cors_origins="*", cors_methods=["post"]),
     memory=options.MemoryOption.GB_1,
+    cpu=1,
+    concurrency=40,
     invoker="public",
 )
 def advisorChatPy(request: https_fn.Request) -> https_fn.Response:
@@ -143,11 +180,11 @@ def advisorChatPy(request: https_fn.Request) -> https_fn.Response:
     session_id = payload.get('sessionId')
     conversation_history = payload.get('conversationHistory') or []
 
-    session, is_new = asyncio.run(get_or_create_session(user_id, session_id))
+    session, is_new = event_loop.run(get_or_create_session(user_id, session_id))
     history_text = _format_history(conversation_history) if is_new and conversation_history else ''
     prompt = f"Conversation so far:\n{history_text}\n\nUSER: {message}" if history_text else message
 
-    text, sources, errors = _collect_agent_text(user_id, session.id, prompt)
+    text, sources, errors = event_loop.run(_collect_agent_text(user_id, session.id, prompt))
     if errors and not text:
         return https_fn.Response(
             json.dumps({'error': 'Model request failed', 'details': errors, 'sessionId': session.id}),
@@ -163,6 +200,8 @@ def advisorChatPy(request: https_fn.Request) -> https_fn.Response:
 @https_fn.on_request(
     cors=options.CorsOptions(cors_origins="*", cors_methods=["post"]),
     memory=options.MemoryOption.GB_1,
+    cpu=1,
+    concurrency=40,
     invoker="public",
 )
 def advisorChatStreamPy(request: https_fn.Request) -> https_fn.Response:
@@ -179,42 +218,34 @@ def advisorChatStreamPy(request: https_fn.Request) -> https_fn.Response:
     session_id = payload.get('sessionId')
     conversation_history = payload.get('conversationHistory') or []
 
-    session, is_new = asyncio.run(get_or_create_session(user_id, session_id))
+    session, is_new = event_loop.run(get_or_create_session(user_id, session_id))
     history_text = _format_history(conversation_history) if is_new and conversation_history else ''
     prompt = f"Conversation so far:\n{history_text}\n\nUSER: {message}" if history_text else message
 
-    def event_stream():
-        sources: List[Dict[str, Any]] = []
-        errors: List[str] = []
-        for event in trade_sync_runner.run(
-            user_id=user_id,
-            session_id=session.id,
-            new_message=types.Content(role='user', parts=[types.Part(text=prompt)]),
-        ):
-            for chunk in _iter_event_text(event):
-                yield f"event: text\ndata: {json.dumps(chunk)}\n\n"
-            error_message = _event_error(event)
-            if error_message:
-                errors.append(error_message)
-                yield f"event: error\ndata: {json.dumps(error_message)}\n\n"
-            if event.content and event.content.parts:
-                for part in event.content.parts:
-                    if part.function_call:
-                        yield f"event: function_call\ndata: {json.dumps({'name': part.function_call.name, 'args': part.function_call.args})}\n\n"
-
-            for response in event.get_function_responses():
-                sources.extend(_extract_sources_from_response(response))
-
-        if errors and not sources:
-            yield f"event: error\ndata: {json.dumps('Model request failed. Check server logs for details.')}\n\n"
-        yield f"event: sources\ndata: {json.dumps(_dedupe_sources(sources))}\n\n"
-        yield "event: done\ndata: {}\n\n"
-
     return https_fn.Response(
-        stream_with_context(event_stream()),
+        event_loop.iterate(_stream_agent_events(user_id, session.id, prompt)),
         headers={
             'Content-Type': 'text/event-stream',
             'Cache-Control': 'no-cache, no-transform',
             'Connection': 'keep-alive',
         },
     )
+
+
+@https_fn.on_request(
+    memory=options.MemoryOption.GB_1,
+    timeout_sec=540,
+    invoker="private",
+)
+def adkMaintenancePy(request: https_fn.Request) -> https_fn.Response:
+    """Deletes idle sessions and consolidates old memories; meant for Cloud Scheduler."""
+    try:
+        result = event_loop.run(run_maintenance())
+    except Exception as exc:
+        print(f'[Maintenance] failed: {exc}')
+        return https_fn.Response(
+            json.dumps({'error': str(exc)}),
+            status=500,
+            headers={'Content-Type': 'application/json'},
+        )
+    return https_fn.Response(json.dumps(result), headers={'Content-Type': 'application/json'})
@@ -0,0 +1,253 @@
+"""Incremental indicator state for streaming candle updates."""
+
+from __future__ import annotations
+
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import numpy as np
+
+from . import config
+from . import indicators
+from .cache import TtlCache
+
+RSI_PERIOD = 14
+MACD_FAST = 12
+MACD_SLOW = 26
+MACD_SIGNAL = 9
+
+_ACCUMULATOR_FIELDS = (
+    'count',
+    'last_close',
+    'ema_fast',
+    'ema_slow',
+    'macd_signal',
+    'gain_sum',
+    'loss_sum',
+    'avg_gain',
+    'avg_loss',
+)
+
+
+class IndicatorState:
+    """EMA/RSI/MACD accumulators for one symbol and interval.
+
+    Each new close updates the indicators in O(1). Re-sending the bar with the
+    latest timestamp replaces it, so the in-progress candle can be polled
+    repeatedly. A bounded window of recent bars is kept for window statistics.
+    """
+
+    def __init__(self, *, symbol: str, source: str, interval: str, window: int = 60) -> None:
+        self.symbol = symbol
+        self.source = source
+        self.interval = interval
+        self.window = max(1, window)
+        self.last_timestamp: Optional[int] = None
+        self.bars: Deque[List[float]] = deque(maxlen=self.window)
+
+        self.count = 0
+        self.last_close = 0.0
+        self.ema_fast = 0.0
+        self.ema_slow = 0.0
+        self.macd_signal = 0.0
+        self.gain_sum = 0.0
+        self.loss_sum = 0.0
+        self.avg_gain: Optional[float] = None
+        self.avg_loss: Optional[float] = None
+        self._previous: Optional[Dict[str, Any]] = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_series(cls, series: Dict[str, Any], window: Optional[int] = None) -> 'IndicatorState':
+        closes = np.asarray(series['closes'], dtype=np.float64)
+        state = cls(
+            symbol=series['symbol'],
+            source=series['source'],
+            interval=series['interval'],
+            window=window or max(len(closes), 1),
+        )
+        timestamps = series.get('timestamps') or [None] * len(closes)
+        highs = series.get('highs') or series['closes']
+        lows = series.get('lows') or series['closes']
+        volumes = series.get('volumes') or [0.0] * len(closes)
+
+        # Seed everything but the last bar in one vectorized pass, then stream the last
+        # bar so it can still be replaced while the candle is open.
+        head = closes[:-1]
+        if head.size > RSI_PERIOD + 1:
+            state._seed(head)
+            for i in range(max(0, head.size - state.window), head.size):
+                state.bars.append([timestamps[i] or 0, highs[i], lows[i], float(head[i]), volumes[i]])
+            state.last_timestamp = timestamps[head.size - 1]
+            start = head.size
+        else:
+            start = 0
+
+        for i in range(start, len(closes)):
+            state.update(float(closes[i]), timestamp=timestamps[i], high=highs[i], low=lows[i], volume=volumes[i])
+        return state
+
+    def _seed(self, closes: np.ndarray) -> None:
+        self.count = int(closes.size)
+        self.last_close = float(closes[-1])
+        macd_line, signal_line, _ = indicators.macd(closes, MACD_FAST, MACD_SLOW, MACD_SIGNAL)
+        self.ema_fast = float(indicators.ema(closes, MACD_FAST)[-1])
+        self.ema_slow = self.ema_fast - float(macd_line[-1])
+        self.macd_signal = float(signal_line[-1])
+        avg_gain, avg_loss = indicators.rsi_averages(closes, RSI_PERIOD)
+        self.avg_gain = float(avg_gain[-1])
+        self.avg_loss = float(avg_loss[-1])
+
+    def _accumulators(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in _ACCUMULATOR_FIELDS}
+
+    def _restore(self, snapshot: Dict[str, Any]) -> None:
+        for name in _ACCUMULATOR_FIELDS:
+            setattr(self, name, snapshot[name])
+
+    def update(
+        self,
+        close: float,
+        *,
+        timestamp: Optional[int] = None,
+        high: Optional[float] = None,
+        low: Optional[float] = None,
+        volume: float = 0.0,
+    ) -> None:
+        close = float(close)
+        bar = [timestamp or 0, float(high if high is not None else close), float(low if low is not None else close), close, float(volume or 0.0)]
+        with self._lock:
+            replace = timestamp is not None and timestamp == self.last_timestamp and self._previous is not None
+            if replace:
+                self._restore(self._previous)
+                if self.bars:
+                    self.bars[-1] = bar
+            else:
+                self._previous = self._accumulators()
+                self.bars.append(bar)
+            self.last_timestamp = timestamp
+            self._apply(close)
+
+    def _apply(self, close: float) -> None:
+        if self.count == 0:
+            self.ema_fast = close
+            self.ema_slow = close
+            self.macd_signal = 0.0
+        else:
+            k_fast = 2.0 / (MACD_FAST + 1)
+            k_slow = 2.0 / (MACD_SLOW + 1)
+            k_signal = 2.0 / (MACD_SIGNAL + 1)
+            self.ema_fast = close * k_fast + self.ema_fast * (1 - k_fast)
+            self.ema_slow = close * k_slow + self.ema_slow * (1 - k_slow)
+            line = self.ema_fast - self.ema_slow
+            self.macd_signal = line * k_signal + self.macd_signal * (1 - k_signal)
+
+            change = close - self.last_close
+            gain = max(change, 0.0)
+            loss = max(-change, 0.0)
+            if self.avg_gain is None or self.avg_loss is None:
+                self.gain_sum += gain
+                self.loss_sum += loss
+                if self.count == RSI_PERIOD:
+                    self.avg_gain = self.gain_sum / RSI_PERIOD
+                    self.avg_loss = self.loss_sum / RSI_PERIOD
+            else:
+                self.avg_gain = (self.avg_gain * (RSI_PERIOD - 1) + gain) / RSI_PERIOD
+                self.avg_loss = (self.avg_loss * (RSI_PERIOD - 1) + loss) / RSI_PERIOD
+
+        self.count += 1
+        self.last_close = close
+
+    def extend(self, series: Dict[str, Any]) -> bool:
+        """Apply newly fetched bars. Returns False when they leave a gap and the state must be reseeded."""
+        timestamps = series.get('timestamps') or []
+        closes = series.get('closes') or []
+        if not timestamps or self.last_timestamp is None or timestamps[0] > self.last_timestamp:
+            return False
+        highs = series.get('highs') or closes
+        lows = series.get('lows') or closes
+        volumes = series.get('volumes') or [0.0] * len(closes)
+        with self._lock:
+            for i, timestamp in enumerate(timestamps):
+                if timestamp < self.last_timestamp:
+                    continue
+                self.update(closes[i], timestamp=timestamp, high=highs[i], low=lows[i], volume=volumes[i])
+        return True
+
+    @property
+    def rsi(self) -> float:
+        if self.avg_gain is None or self.avg_loss is None:
+            return 50.0
+        return float(indicators.rsi_from_averages(self.avg_gain, self.avg_loss))
+
+    @property
+    def macd(self) -> Dict[str, float]:
+        if self.count < MACD_SLOW:
+            return {'value': 0.0, 'signal': 0.0, 'histogram': 0.0}
+        line = self.ema_fast - self.ema_slow
+        return {'value': line, 'signal': self.macd_signal, 'histogram': line - self.macd_signal}
+
+    def series(self) -> Dict[str, Any]:
+        with self._lock:
+            columns = list(zip(*self.bars)) if self.bars else [(), (), (), (), ()]
+        return {
+            'symbol': self.symbol,
+            'source': self.source,
+            'interval': self.interval,
+            'timestamps': list(columns[0]),
+            'highs': list(columns[1]),
+            'lows': list(columns[2]),
+            'closes': list(columns[3]),
+            'prices': list(columns[3]),
+            'volumes': list(columns[4]),
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'symbol': self.symbol,
+            'source': self.source,
+            'interval': self.interval,
+            'window': self.window,
+            'lastTimestamp': self.last_timestamp,
+            'bars': [list(bar) for bar in self.bars],
+            'accumulators': self._accumulators(),
+            'previous': self._previous,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'IndicatorState':
+        state = cls(
+            symbol=data['symbol'],
+            source=data['source'],
+            interval=data['interval'],
+            window=int(data.get('window') or 60),
+        )
+        state.last_timestamp = data.get('lastTimestamp')
+        state.bars.extend(list(bar) for bar in data.get('bars') or [])
+        state._restore(data['accumulators'])
+        state._previous = data.get('previous')
+        return state
+
+
+class IndicatorStateStore:
+    """Per-instance registry of indicator states keyed by symbol and interval."""
+
+    def __init__(self, *, max_size: int = 500, ttl_seconds: int = 21600) -> None:
+        self._cache = TtlCache[IndicatorState](max_size=max_size, ttl_seconds=ttl_seconds)
+
+    @staticmethod
+    def _key(symbol: str, interval: str) -> str:
+        return f"{symbol}:{interval}"
+
+    def get(self, symbol: str, interval: str) -> Optional[IndicatorState]:
+        return self._cache.get(self._key(symbol, interval))
+
+    def put(self, symbol: str, state: IndicatorState) -> None:
+        self._cache.set(self._key(symbol, state.interval), state)
+
+
+indicator_states = IndicatorStateStore(
+    max_size=config.INDICATOR_STATE_MAX or 500,
+    ttl_seconds=config.INDICATOR_STATE_TTL_SECONDS or 21600,
+)
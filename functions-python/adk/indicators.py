@@ -0,0 +1,224 @@
+"""Vectorized technical indicators for TradeSync ADK (Python).
+
+Every function accepts a 1-D series or a 2-D ``symbols x time`` matrix and
+operates along the last axis. Warm-up positions are filled with NaN.
+"""
+
+from __future__ import annotations
+
+import math
+from typing import Tuple
+
+import numpy as np
+
+# Largest exponent used when rescaling EMA blocks; keeps decay ** -n well inside float64 range.
+_MAX_DECAY_EXPONENT = 500.0
+
+
+def _as_array(values) -> np.ndarray:
+    return np.asarray(values, dtype=np.float64)
+
+
+def _nan_like(values: np.ndarray) -> np.ndarray:
+    return np.full(values.shape, np.nan, dtype=np.float64)
+
+
+def _pad_front(values: np.ndarray, count: int) -> np.ndarray:
+    if count <= 0:
+        return values
+    pad = np.full(values.shape[:-1] + (count,), np.nan, dtype=np.float64)
+    return np.concatenate([pad, values], axis=-1)
+
+
+def _rolling(values: np.ndarray, window: int) -> np.ndarray:
+    return np.lib.stride_tricks.sliding_window_view(values, window, axis=-1)
+
+
+def ewm(values, alpha: float, seed=None) -> np.ndarray:
+    """Recursive y[t] = (1 - alpha) * y[t-1] + alpha * x[t], seeded with ``seed`` (default: first value)."""
+    x = _as_array(values)
+    length = x.shape[-1]
+    if length == 0:
+        return x.copy()
+    decay = 1.0 - alpha
+    if decay <= 0:
+        return x.copy()
+
+    prev = _as_array(x[..., 0] if seed is None else seed)
+    out = np.empty_like(x)
+    # Closed form per block: y[t] = decay^(t+1) * (prev + alpha * sum_j x[j] / decay^(j+1)).
+    block = max(1, int(_MAX_DECAY_EXPONENT / -math.log(decay)))
+    for start in range(0, length, block):
+        chunk = x[..., start : start + block]
+        size = chunk.shape[-1]
+        powers = decay ** np.arange(1, size + 1, dtype=np.float64)
+        scaled = np.cumsum(chunk / powers, axis=-1) * alpha
+        out[..., start : start + size] = powers * (prev[..., None] + scaled)
+        prev = out[..., start + size - 1]
+    return out
+
+
+def wilder(values, period: int) -> np.ndarray:
+    """Wilder smoothing: SMA seed over the first ``period`` values, then alpha = 1 / period."""
+    x = _as_array(values)
+    if period <= 0 or x.shape[-1] < period:
+        return _nan_like(x)
+    seed = x[..., :period].mean(axis=-1)
+    tail = ewm(x[..., period:], 1.0 / period, seed=seed)
+    return _pad_front(np.concatenate([seed[..., None], tail], axis=-1), period - 1)
+
+
+def sma(values, period: int) -> np.ndarray:
+    x = _as_array(values)
+    if period <= 0 or x.shape[-1] < period:
+        return _nan_like(x)
+    return _pad_front(_rolling(x, period).mean(axis=-1), period - 1)
+
+
+def ema(values, period: int) -> np.ndarray:
+    return ewm(values, 2.0 / (period + 1))
+
+
+def rsi_averages(closes, period: int = 14) -> Tuple[np.ndarray, np.ndarray]:
+    """Wilder-smoothed average gain and loss, aligned with ``closes``."""
+    x = _as_array(closes)
+    if x.shape[-1] < period + 1:
+        return _nan_like(x), _nan_like(x)
+    deltas = np.diff(x, axis=-1)
+    avg_gain = wilder(np.clip(deltas, 0, None), period)
+    avg_loss = wilder(np.clip(-deltas, 0, None), period)
+    return _pad_front(avg_gain, 1), _pad_front(avg_loss, 1)
+
+
+def rsi_from_averages(avg_gain, avg_loss):
+    gain = _as_array(avg_gain)
+    loss = _as_array(avg_loss)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = 100.0 - 100.0 / (1.0 + gain / loss)
+    values = np.where(loss == 0, np.where(gain == 0, 50.0, 100.0), values)
+    return np.where(np.isnan(gain), np.nan, values)
+
+
+def rsi(closes, period: int = 14) -> np.ndarray:
+    """Wilder-smoothed RSI."""
+    return rsi_from_averages(*rsi_averages(closes, period))
+
+
+def macd(closes, fast: int = 12, slow: int = 26, signal: int = 9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """MACD line, signal line and histogram."""
+    x = _as_array(closes)
+    line = ema(x, fast) - ema(x, slow)
+    signal_line = ema(line, signal)
+    return line, signal_line, line - signal_line
+
+
+def bollinger(closes, period: int = 20, num_std: float = 2.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Middle, upper and lower Bollinger bands (population standard deviation)."""
+    x = _as_array(closes)
+    if x.shape[-1] < period:
+        empty = _nan_like(x)
+        return empty, empty.copy(), empty.copy()
+    windows = _rolling(x, period)
+    middle = _pad_front(windows.mean(axis=-1), period - 1)
+    std = _pad_front(windows.std(axis=-1), period - 1)
+    return middle, middle + num_std * std, middle - num_std * std
+
+
+def true_range(highs, lows, closes) -> np.ndarray:
+    high = _as_array(highs)
+    low = _as_array(lows)
+    close = _as_array(closes)
+    prev_close = np.concatenate([close[..., :1], close[..., :-1]], axis=-1)
+    return np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+
+def atr(highs, lows, closes, period: int = 14) -> np.ndarray:
+    """Wilder Average True Range."""
+    return wilder(true_range(highs, lows, closes), period)
+
+
+def stochastic(highs, lows, closes, k_period: int = 14, d_period: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+    """Stochastic oscillator %K and %D."""
+    high = _as_array(highs)
+    low = _as_array(lows)
+    close = _as_array(closes)
+    if close.shape[-1] < k_period:
+        empty = _nan_like(close)
+        return empty, empty.copy()
+    highest = _rolling(high, k_period).max(axis=-1)
+    lowest = _rolling(low, k_period).min(axis=-1)
+    span = highest - lowest
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k_values = np.where(span > 0, 100.0 * (close[..., k_period - 1 :] - lowest) / span, 50.0)
+    d_values = sma(k_values, d_period)
+    return _pad_front(k_values, k_period - 1), _pad_front(d_values, k_period - 1)
+
+
+def adx(highs, lows, closes, period: int = 14) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Average Directional Index with +DI and -DI."""
+    high = _as_array(highs)
+    low = _as_array(lows)
+    close = _as_array(closes)
+    if close.shape[-1] < 2 * period + 1:
+        empty = _nan_like(close)
+        return empty, empty.copy(), empty.copy()
+
+    up_move = np.diff(high, axis=-1)
+    down_move = -np.diff(low, axis=-1)
+    plus_dm = np.where((up_move > down_move) & (up_move > 0), up_move, 0.0)
+    minus_dm = np.where((down_move > up_move) & (down_move > 0), down_move, 0.0)
+    tr = true_range(high, low, close)[..., 1:]
+
+    smoothed_tr = wilder(tr, period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        plus_di = np.where(smoothed_tr > 0, 100.0 * wilder(plus_dm, period) / smoothed_tr, 0.0)
+        minus_di = np.where(smoothed_tr > 0, 100.0 * wilder(minus_dm, period) / smoothed_tr, 0.0)
+        di_sum = plus_di + minus_di
+        dx = np.where(di_sum > 0, 100.0 * np.abs(plus_di - minus_di) / di_sum, 0.0)
+    plus_di = np.where(np.isnan(smoothed_tr), np.nan, plus_di)
+    minus_di = np.where(np.isnan(smoothed_tr), np.nan, minus_di)
+
+    adx_values = _pad_front(wilder(dx[..., period - 1 :], period), period - 1)
+    return _pad_front(adx_values, 1), _pad_front(plus_di, 1), _pad_front(minus_di, 1)
+
+
+def obv(closes, volumes) -> np.ndarray:
+    """On-balance volume, starting at zero."""
+    close = _as_array(closes)
+    volume = _as_array(volumes)
+    if close.shape[-1] == 0:
+        return close.copy()
+    flow = np.sign(np.diff(close, axis=-1)) * volume[..., 1:]
+    zero = np.zeros(close.shape[:-1] + (1,), dtype=np.float64)
+    return np.concatenate([zero, np.cumsum(flow, axis=-1)], axis=-1)
+
+
+def vwap(highs, lows, closes, volumes) -> np.ndarray:
+    """Volume-weighted average price anchored at the first bar of the series."""
+    typical = (_as_array(highs) + _as_array(lows) + _as_array(closes)) / 3.0
+    volume = _as_array(volumes)
+    cumulative_volume = np.cumsum(volume, axis=-1)
+    cumulative_value = np.cumsum(typical * volume, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(cumulative_volume > 0, cumulative_value / cumulative_volume, typical)
+
+
+def signal_score(rsi_values, macd_histogram, sentiment_score) -> np.ndarray:
+    """Composite signal score used by ``calculate_signal``; broadcasts over arrays of symbols."""
+    rsi_arr = _as_array(rsi_values)
+    hist = _as_array(macd_histogram)
+    sentiment = _as_array(sentiment_score)
+    score = np.where(rsi_arr < 30, 25.0, np.where(rsi_arr > 70, -25.0, 0.0))
+    score = score + np.where(hist > 0, 25.0, np.where(hist < 0, -25.0, 0.0))
+    return score + sentiment * 50.0
+
+
+def last(values, fallback: float = 0.0):
+    """Latest value along the last axis, replacing warm-up NaNs with ``fallback``."""
+    x = _as_array(values)
+    if x.shape[-1] == 0:
+        return fallback if x.ndim == 1 else np.full(x.shape[:-1], fallback)
+    latest = x[..., -1]
+    if x.ndim == 1:
+        return float(latest) if np.isfinite(latest) else fallback
+    return np.where(np.isfinite(latest), latest, fallback)
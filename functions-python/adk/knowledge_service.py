@@ -1,17 +1,23 @@
-"""Knowledge base search (RAG) via Firestore vector search."""
+"""Knowledge base search (RAG): vector search fused with BM25 keyword matches."""
 
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Any, List
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
 
 import firebase_admin
 from firebase_admin import firestore
+from google.cloud.firestore_v1 import FieldFilter
 from google.cloud.firestore_v1.base_vector_query import DistanceMeasure
 
 from . import config
 from .cache import TtlCache
+from .cache_backends import get_shared_backend
 from .genai_client import generate_embedding
+from .lexical_index import LexicalIndex
+from .semantic_cache import SemanticCache
+from .vector_index import LocalVectorIndex
 
 
 def _ensure_firebase() -> None:
@@ -24,54 +30,238 @@ class ChunkResult:
     content: str
     metadata: dict[str, Any]
     similarity: float
+    id: str = ''
+
+
+@dataclass(frozen=True)
+class KnowledgeFilters:
+    """Metadata restrictions for ``search_knowledge``; unset fields do not filter."""
+
+    source_type: Optional[str] = None
+    title: Optional[str] = None
+    page_from: Optional[int] = None
+    page_to: Optional[int] = None
+    max_age_days: Optional[int] = None
+
+    def is_empty(self) -> bool:
+        return not (self.source_type or self.title or self.page_from or self.page_to or self.max_age_days)
+
+    def cache_key(self) -> str:
+        return f"{self.source_type or ''}|{self.title or ''}|{self.page_from or ''}-{self.page_to or ''}|{self.max_age_days or ''}"
+
+    def created_after(self) -> Optional[datetime]:
+        if not self.max_age_days:
+            return None
+        return datetime.now(timezone.utc) - timedelta(days=self.max_age_days)
+
+    def has_page_range(self) -> bool:
+        return bool(self.page_from or self.page_to)
+
+    def matches_page(self, metadata: Dict[str, Any]) -> bool:
+        if not self.has_page_range():
+            return True
+        try:
+            page = int(metadata.get('pageNumber', metadata.get('page_number')))
+        except (TypeError, ValueError):
+            # Missing or unparsable (e.g. '12a') pages never match a page range.
+            return False
+        if self.page_from and page < self.page_from:
+            return False
+        if self.page_to and page > self.page_to:
+            return False
+        return True
+
+    def matches(self, doc: Dict[str, Any]) -> bool:
+        metadata = doc.get('metadata') or {}
+        if self.source_type and metadata.get('sourceType') != self.source_type:
+            return False
+        if self.title and metadata.get('title') != self.title:
+            return False
+        if not self.matches_page(metadata):
+            return False
+        created_after = self.created_after()
+        if created_after is not None:
+            created_at = doc.get('createdAt')
+            if not created_at or datetime.fromisoformat(created_at) < created_after:
+                return False
+        return True
 
 
 _cache = TtlCache[List[ChunkResult]](
     max_size=config.RAG_CACHE_MAX or 200,
     ttl_seconds=config.RAG_CACHE_TTL_SECONDS or 600,
+    negative_ttl_seconds=config.RAG_CACHE_NEGATIVE_TTL_SECONDS or 0,
+    stale_seconds=config.RAG_CACHE_STALE_SECONDS or 0,
+    name='rag',
+    backend=get_shared_backend(),
+    promote=config.CACHE_L2_PROMOTE,
 )
 
 
-def search_knowledge(query: str, limit: int = 5) -> List[ChunkResult]:
+_semantic_cache = SemanticCache[List[ChunkResult]](
+    max_size=config.SEMANTIC_CACHE_MAX or 512,
+    threshold=config.SEMANTIC_CACHE_THRESHOLD or 0.95,
+    ttl_seconds=config.RAG_CACHE_TTL_SECONDS or 600,
+    name='rag',
+)
+
+
+_local_index: Optional[LocalVectorIndex] = None
+_lexical_index: Optional[LexicalIndex] = None
+
+
+def _get_local_index() -> Optional[LocalVectorIndex]:
+    global _local_index
+    if not config.VECTOR_INDEX_ENABLED:
+        return None
+    if _local_index is None:
+        _ensure_firebase()
+        _local_index = LocalVectorIndex(
+            config.VECTOR_INDEX_DIR or '/tmp/tradesync_rag_index',
+            load_collection=lambda: firestore.client().collection('rag_chunks'),
+            refresh_seconds=config.VECTOR_INDEX_REFRESH_SECONDS or 300,
+            rebuild_seconds=config.VECTOR_INDEX_REBUILD_SECONDS or 21600,
+            ivf_min_rows=config.VECTOR_INDEX_IVF_MIN_ROWS or 4096,
+            nprobe=config.VECTOR_INDEX_NPROBE or 16,
+        )
+    return _local_index
+
+
+def _search_local(vector: List[float], limit: int, filters: KnowledgeFilters) -> Optional[List[ChunkResult]]:
+    index = _get_local_index()
+    if index is None:
+        return None
+    hits = index.search(vector, limit, predicate=None if filters.is_empty() else filters.matches)
+    if hits is None:
+        return None
+    return [_doc_result(doc, similarity) for doc, similarity in hits]
+
+
+def _get_lexical_index() -> Optional[LexicalIndex]:
+    global _lexical_index
+    if not config.RAG_HYBRID_ENABLED:
+        return None
+    if _lexical_index is None:
+        _ensure_firebase()
+        _lexical_index = LexicalIndex(
+            load_collection=lambda: firestore.client().collection('rag_chunks'),
+            refresh_seconds=config.VECTOR_INDEX_REFRESH_SECONDS or 300,
+            rebuild_seconds=config.VECTOR_INDEX_REBUILD_SECONDS or 21600,
+        )
+    return _lexical_index
+
+
+def _doc_result(doc: Dict[str, Any], similarity: float) -> ChunkResult:
+    return ChunkResult(
+        content=doc.get('content', ''),
+        metadata=doc.get('metadata') or {},
+        similarity=similarity,
+        id=doc.get('id', ''),
+    )
+
+
+def _fuse(vector_results: List[ChunkResult], lexical_hits: List[Tuple[Dict[str, Any], float]], limit: int) -> List[ChunkResult]:
+    # Reciprocal rank fusion: each list contributes 1 / (k + rank) per document.
+    k = config.RAG_RRF_K or 60
+    scores: Dict[str, float] = {}
+    results: Dict[str, ChunkResult] = {}
+    for rank, result in enumerate(vector_results):
+        key = result.id or result.content
+        scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+        results[key] = result
+    for rank, (doc, _) in enumerate(lexical_hits):
+        key = doc.get('id') or doc.get('content', '')
+        scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank + 1)
+        results.setdefault(key, _doc_result(doc, 0.0))
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [results[key] for key in ranked[:limit]]
+
+
+def search_knowledge(query: str, limit: int = 5, filters: Optional[KnowledgeFilters] = None) -> List[ChunkResult]:
     normalized_query = query.strip().lower()
     if not normalized_query:
         return []
 
+    filters = filters or KnowledgeFilters()
     cache_key = f"{normalized_query}:{limit}"
-    cached = _cache.get(cache_key)
-    if cached is not None:
-        return cached
+    if not filters.is_empty():
+        cache_key = f"{cache_key}:{filters.cache_key()}"
+    return _cache.get_or_load(cache_key, lambda: _search_knowledge_uncached(query, limit, filters)) or []
 
-    _ensure_firebase()
-    db = firestore.client()
 
+def _search_knowledge_uncached(query: str, limit: int, filters: KnowledgeFilters) -> Optional[List[ChunkResult]]:
     try:
-        vector = generate_embedding(query, 'RETRIEVAL_QUERY')
-        collection = db.collection('rag_chunks')
-        vector_query = collection.find_nearest(
-            'embedding',
-            vector,
-            limit=limit,
-            distance_measure=DistanceMeasure.COSINE,
-            distance_result_field='_distance',
-        )
-        snapshot = vector_query.get()
-
-        results: List[ChunkResult] = []
-        for doc in snapshot:
-            data = doc.to_dict() or {}
-            distance = data.get('_distance') or data.get('distance')
-            similarity = 1 - float(distance) if distance is not None else 0.0
-            results.append(
-                ChunkResult(
-                    content=data.get('content', ''),
-                    metadata=data.get('metadata') or {},
-                    similarity=similarity,
-                )
+        lexical_index = _get_lexical_index()
+        lexical = None
+        if lexical_index is not None:
+            lexical = lexical_index.search(
+                query,
+                max(limit, config.RAG_HYBRID_DEPTH or 20),
+                predicate=None if filters.is_empty() else filters.matches,
             )
+        if lexical is not None:
+            hits, confident = lexical
+            if confident:
+                return [_doc_result(doc, 0.0) for doc, _ in hits[:limit]]
+        hits = lexical[0] if lexical else []
 
-        _cache.set(cache_key, results)
+        depth = max(limit, config.RAG_HYBRID_DEPTH or 20) if hits else limit
+        vector = generate_embedding(query, 'RETRIEVAL_QUERY')
+        namespace = f"{limit}:{filters.cache_key()}"
+        if config.SEMANTIC_CACHE_ENABLED:
+            similar = _semantic_cache.lookup(namespace, vector)
+            if similar is not None:
+                return similar
+
+        vector_results = _search_local(vector, depth, filters)
+        if vector_results is None:
+            vector_results = _search_firestore(vector, depth, filters)
+        results = _fuse(vector_results, hits, limit) if hits else vector_results[:limit]
+        if config.SEMANTIC_CACHE_ENABLED:
+            _semantic_cache.store(namespace, vector, results)
         return results
     except Exception as exc:  # pragma: no cover - network/runtime dependent
         print(f'[RAG] search failed: {exc}')
-        return []
+        return None
+
+
+def _search_firestore(vector: List[float], limit: int, filters: KnowledgeFilters) -> List[ChunkResult]:
+    _ensure_firebase()
+    db = firestore.client()
+    query = db.collection('rag_chunks')
+    if filters.source_type:
+        query = query.where(filter=FieldFilter('metadata.sourceType', '==', filters.source_type))
+    if filters.title:
+        query = query.where(filter=FieldFilter('metadata.title', '==', filters.title))
+    created_after = filters.created_after()
+    if created_after is not None:
+        query = query.where(filter=FieldFilter('createdAt', '>=', created_after))
+
+    # The page range is applied after the vector query (a second range filter would need
+    # an index per combination), so over-fetch to keep ``limit`` results after filtering.
+    fetch_limit = min(limit * 4, 1000) if filters.has_page_range() else limit
+    vector_query = query.find_nearest(
+        'embedding',
+        vector,
+        limit=fetch_limit,
+        distance_measure=DistanceMeasure.COSINE,
+        distance_result_field='_distance',
+    )
+    snapshot = vector_query.get()
+
+    results: List[ChunkResult] = []
+    for doc in snapshot:
+        data = doc.to_dict() or {}
+        if not filters.matches_page(data.get('metadata') or {}):
+            continue
+        distance = data.get('_distance') or data.get('distance')
+        similarity = 1 - float(distance) if distance is not None else 0.0
+        results.append(
+            ChunkResult(
+                content=data.get('content', ''),
+                metadata=data.get('metadata') or {},
+                similarity=similarity,
+                id=doc.id,
+            )
+        )
+    return results[:limit]
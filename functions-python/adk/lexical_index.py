@@ -0,0 +1,196 @@
+"""In-memory BM25 index over rag_chunks content."""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from google.cloud.firestore_v1 import FieldFilter
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+(?:[.\-][a-z0-9]+)*')
+_STOPWORDS = frozenset(
+    'a an and are as at be by can do does for from how i in is it me my of on or should '
+    'the this to was what when where which who why will with you your about explain tell'.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in _TOKEN_RE.findall((text or '').lower()) if token not in _STOPWORDS]
+
+
+@dataclass
+class _Postings:
+    docs: List[Dict[str, Any]]
+    ids: set
+    terms: Dict[str, Tuple[np.ndarray, np.ndarray]]
+    lengths: np.ndarray
+    marker: Optional[datetime]
+    built_at: float
+    refreshed_at: float
+
+
+def _build(docs: List[Dict[str, Any]], marker: Optional[datetime], built_at: float) -> _Postings:
+    postings: Dict[str, Tuple[List[int], List[int]]] = {}
+    lengths = np.zeros(len(docs), dtype=np.float32)
+    for row, doc in enumerate(docs):
+        metadata = doc.get('metadata') or {}
+        counts = Counter(tokenize(f"{metadata.get('title') or ''} {doc.get('content') or ''}"))
+        lengths[row] = sum(counts.values())
+        for term, count in counts.items():
+            rows, tfs = postings.setdefault(term, ([], []))
+            rows.append(row)
+            tfs.append(count)
+    terms = {
+        term: (np.asarray(rows, dtype=np.int32), np.asarray(tfs, dtype=np.float32))
+        for term, (rows, tfs) in postings.items()
+    }
+    return _Postings(
+        docs=docs,
+        ids={doc['id'] for doc in docs},
+        terms=terms,
+        lengths=lengths,
+        marker=marker,
+        built_at=built_at,
+        refreshed_at=time.time(),
+    )
+
+
+class LexicalIndex:
+    """BM25 over a periodically refreshed in-memory copy of a text collection.
+
+    Like ``LocalVectorIndex`` it refreshes in the background from a ``createdAt``
+    marker and rebuilds fully every ``rebuild_seconds``; ``search`` returns None
+    until the first load completes.
+    """
+
+    def __init__(
+        self,
+        *,
+        load_collection: Callable[[], Any],
+        refresh_seconds: int = 300,
+        rebuild_seconds: int = 21600,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ) -> None:
+        self._load_collection = load_collection
+        self._refresh_seconds = max(1, refresh_seconds)
+        self._rebuild_seconds = max(self._refresh_seconds, rebuild_seconds)
+        self._k1 = k1
+        self._b = b
+        self._postings: Optional[_Postings] = None
+        self._refreshing = threading.Lock()
+        self._attempted_at = 0.0
+
+    def _fetch(self, marker: Optional[datetime]) -> Tuple[List[Dict[str, Any]], Optional[datetime]]:
+        query = self._load_collection().select(['content', 'metadata', 'createdAt'])
+        if marker is not None:
+            query = query.where(filter=FieldFilter('createdAt', '>=', marker)).order_by('createdAt')
+        docs: List[Dict[str, Any]] = []
+        newest = marker
+        for doc in query.stream():
+            data = doc.to_dict() or {}
+            created_at = data.get('createdAt')
+            if isinstance(created_at, datetime) and (newest is None or created_at > newest):
+                newest = created_at
+            docs.append({
+                'id': doc.id,
+                'content': data.get('content', ''),
+                'metadata': data.get('metadata') or {},
+                'createdAt': created_at.isoformat() if isinstance(created_at, datetime) else None,
+            })
+        return docs, newest
+
+    def refresh(self) -> None:
+        if not self._refreshing.acquire(blocking=False):
+            return
+        self._attempted_at = time.time()
+        try:
+            postings = self._postings
+            if postings is None or time.time() - postings.built_at > self._rebuild_seconds:
+                docs, marker = self._fetch(None)
+                self._postings = _build(docs, marker, time.time())
+            else:
+                docs, marker = self._fetch(postings.marker)
+                fresh = [doc for doc in docs if doc['id'] not in postings.ids]
+                if fresh:
+                    self._postings = _build(postings.docs + fresh, marker, postings.built_at)
+                else:
+                    postings.marker = marker or postings.marker
+                    postings.refreshed_at = time.time()
+        except Exception as exc:  # pragma: no cover - network/runtime dependent
+            print(f'[LexicalIndex] refresh failed: {exc}')
+        finally:
+            self._refreshing.release()
+
+    def _refresh_if_due(self) -> None:
+        if time.time() - self._attempted_at < self._refresh_seconds:
+            return
+        if self._refreshing.locked():
+            return
+        threading.Thread(target=self.refresh, name='lexical-index-refresh', daemon=True).start()
+
+    def search(
+        self,
+        query: str,
+        limit: int,
+        *,
+        predicate: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ) -> Optional[Tuple[List[Tuple[Dict[str, Any], float]], bool]]:
+        """``(hits, confident)`` where hits are ``(doc, bm25 score)`` best first, or None while not loaded.
+
+        ``confident`` is set for short queries made only of distinctive terms when at
+        least ``limit`` documents (or every match) contain all of them, i.e. the
+        lexical ranking alone is a safe answer. ``predicate`` restricts the hits
+        (and the confidence check) to matching docs.
+        """
+        self._refresh_if_due()
+        postings = self._postings
+        if postings is None:
+            return None
+        terms = list(dict.fromkeys(tokenize(query)))
+        count = len(postings.docs)
+        if not terms or not count or limit <= 0:
+            return [], False
+
+        scores = np.zeros(count, dtype=np.float32)
+        coverage = np.zeros(count, dtype=np.int32)
+        average_length = float(postings.lengths.mean()) or 1.0
+        norm = self._k1 * (1 - self._b + self._b * postings.lengths / average_length)
+        distinctive = True
+        for term in terms:
+            entry = postings.terms.get(term)
+            if entry is None:
+                distinctive = False
+                continue
+            rows, tfs = entry
+            frequency = rows.shape[0]
+            idf = np.log(1.0 + (count - frequency + 0.5) / (frequency + 0.5))
+            scores[rows] += idf * tfs * (self._k1 + 1) / (tfs + norm[rows])
+            coverage[rows] += 1
+            if frequency > max(1, 0.05 * count):
+                distinctive = False
+
+        matched = np.flatnonzero(scores > 0)
+        if predicate is not None and matched.size:
+            keep = np.fromiter((predicate(postings.docs[int(row)]) for row in matched), dtype=bool, count=matched.size)
+            matched = matched[keep]
+        if not matched.size:
+            return [], False
+        size = min(limit, matched.size)
+        top = matched[np.argpartition(-scores[matched], size - 1)[:size]]
+        top = top[np.argsort(-scores[top])]
+
+        full_matches = int(np.count_nonzero(coverage[matched] == len(terms)))
+        confident = (
+            distinctive
+            and len(terms) <= 3
+            and full_matches >= min(limit, matched.size)
+            and bool(np.all(coverage[top] == len(terms)))
+        )
+        return [(postings.docs[int(row)], float(scores[row])) for row in top], confident
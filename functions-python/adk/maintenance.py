@@ -0,0 +1,232 @@
+"""Retention and compaction jobs for ADK sessions and memories."""
+
+from __future__ import annotations
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from firebase_admin import firestore
+from google.cloud.firestore_v1 import FieldFilter
+from google.cloud.firestore_v1.field_path import FieldPath
+from google.cloud.firestore_v1.vector import Vector
+
+from . import config
+from .firestore_client import get_async_client
+from .genai_client import generate_embeddings, merge_memories
+
+_BATCH_LIMIT = 400
+_MAX_CLUSTER = 50
+_MERGE_CONCURRENCY = 8
+
+
+class _BatchWriter:
+    """Collects writes into batches of at most ``_BATCH_LIMIT`` operations."""
+
+    def __init__(self) -> None:
+        self._db = get_async_client()
+        self._batch = self._db.batch()
+        self._ops = 0
+
+    async def reserve(self, ops: int) -> None:
+        # Keeps a group of related writes in one batch so it commits atomically.
+        if self._ops + ops > _BATCH_LIMIT:
+            await self.flush()
+
+    async def set(self, ref, data: Dict[str, Any]) -> None:
+        await self.reserve(1)
+        self._batch.set(ref, data)
+        self._ops += 1
+
+    async def delete(self, ref) -> None:
+        await self.reserve(1)
+        self._batch.delete(ref)
+        self._ops += 1
+
+    async def flush(self) -> None:
+        if self._ops:
+            await self._batch.commit()
+            self._batch = self._db.batch()
+            self._ops = 0
+
+
+async def delete_idle_sessions(ttl_days: int, *, limit: int) -> Dict[str, int]:
+    """Deletes up to ``limit`` sessions not updated for ``ttl_days``, events first, then the header."""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=ttl_days)
+    query = (
+        get_async_client().collection('sessions')
+        .where(filter=FieldFilter('lastUpdateTime', '<', cutoff))
+        .order_by('lastUpdateTime')
+        .limit(limit)
+        .select(['lastUpdateTime'])
+    )
+    writer = _BatchWriter()
+    sessions = 0
+    events = 0
+    async for doc in query.stream():
+        async for event in doc.reference.collection('events').select(['timestamp']).stream():
+            await writer.delete(event.reference)
+            events += 1
+        await writer.delete(doc.reference)
+        sessions += 1
+    await writer.flush()
+    return {'sessionsDeleted': sessions, 'eventsDeleted': events}
+
+
+def _cluster(items: List[Dict[str, Any]], threshold: float) -> List[List[Dict[str, Any]]]:
+    items = sorted(items, key=lambda item: item['createdAt'])
+    dimension = len(items[0]['vector'])
+    items = [item for item in items if len(item['vector']) == dimension]
+    matrix = np.asarray([item['vector'] for item in items], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    matrix /= norms
+    similarities = matrix @ matrix.T
+
+    assigned = np.zeros(len(items), dtype=bool)
+    clusters: List[List[Dict[str, Any]]] = []
+    for row in range(len(items)):
+        if assigned[row]:
+            continue
+        members = np.flatnonzero((similarities[row] >= threshold) & ~assigned)[:_MAX_CLUSTER]
+        if members.size >= 2:
+            clusters.append([items[member] for member in members])
+            assigned[members] = True
+    return clusters
+
+
+async def _next_scope(db, after: str) -> Optional[str]:
+    query = db.collection('memories').order_by('scopeKey').limit(1).select(['scopeKey'])
+    if after:
+        query = query.where(filter=FieldFilter('scopeKey', '>', after))
+    async for doc in query.stream():
+        return (doc.to_dict() or {}).get('scopeKey')
+    return None
+
+
+async def consolidate_memories(min_age_days: int, threshold: float, *, limit: int) -> Dict[str, int]:
+    """Merges each user's similar memories older than ``min_age_days`` into single entries.
+
+    Scopes are visited in ``scopeKey`` order from a cursor persisted in
+    ``maintenance/memoryConsolidation``, reading at most ``limit`` documents per
+    run, so memories that never cluster do not keep later scopes from being
+    reached; the cursor wraps around after the last scope.
+
+    Memories are grouped greedily around the oldest unassigned one by cosine
+    similarity; every group of two or more is rewritten as one merged, re-embedded
+    memory that keeps the newest member's timestamps, in the same batch that
+    deletes the members.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=min_age_days)
+    db = get_async_client()
+    cursor_ref = db.collection('maintenance').document('memoryConsolidation')
+    cursor_doc = await cursor_ref.get()
+    cursor = (cursor_doc.to_dict() or {}) if cursor_doc.exists else {}
+    scope: Optional[str] = cursor.get('scopeKey') or await _next_scope(db, '')
+    # Set when the previous run stopped inside ``scope``: the last memory read, as
+    # (createdAt, id) so memories sharing its timestamp are not skipped.
+    resume_at: Optional[datetime] = cursor.get('createdAt')
+    resume_id: Optional[str] = cursor.get('docId')
+
+    by_scope: Dict[str, List[Dict[str, Any]]] = {}
+    scanned = 0
+    while scope is not None and scanned < limit:
+        page = limit - scanned
+        query = (
+            db.collection('memories')
+            .where(filter=FieldFilter('scopeKey', '==', scope))
+            .where(filter=FieldFilter('createdAt', '<', cutoff))
+            .order_by('createdAt', direction=firestore.Query.DESCENDING)
+            .order_by(FieldPath.document_id(), direction=firestore.Query.DESCENDING)
+            .limit(page)
+            .select(['appName', 'userId', 'scopeKey', 'content', 'embedding', 'timestamp', 'createdAt', 'consolidatedCount'])
+        )
+        if resume_at is not None and resume_id:
+            query = query.start_after({
+                'createdAt': resume_at,
+                FieldPath.document_id(): db.collection('memories').document(resume_id),
+            })
+        read = 0
+        last = None
+        async for doc in query.stream():
+            read += 1
+            data = doc.to_dict() or {}
+            last = (data.get('createdAt'), doc.id)
+            embedding = data.get('embedding')
+            if not data.get('content') or embedding is None:
+                continue
+            by_scope.setdefault(scope, []).append({
+                'ref': doc.reference,
+                'data': data,
+                'vector': list(embedding),
+                'createdAt': data.get('createdAt') or cutoff,
+            })
+        scanned += read
+        if read == page and last is not None and last[0] is not None:
+            resume_at, resume_id = last
+            break
+        resume_at = resume_id = None
+        scope = await _next_scope(db, scope)
+        scanned += 1
+
+    await cursor_ref.set({
+        'scopeKey': scope,
+        'createdAt': resume_at,
+        'docId': resume_id,
+        'updatedAt': firestore.SERVER_TIMESTAMP,
+    })
+
+    clusters = [cluster for items in by_scope.values() for cluster in _cluster(items, threshold)]
+    if not clusters:
+        return {'memoryClusters': 0, 'memoriesMerged': 0}
+
+    semaphore = asyncio.Semaphore(_MERGE_CONCURRENCY)
+
+    async def merge(cluster: List[Dict[str, Any]]) -> str:
+        async with semaphore:
+            return await asyncio.to_thread(merge_memories, [item['data']['content'] for item in cluster])
+
+    merged = await asyncio.gather(*(merge(cluster) for cluster in clusters), return_exceptions=True)
+    entries = [(cluster, text) for cluster, text in zip(clusters, merged) if isinstance(text, str) and text]
+    if not entries:
+        return {'memoryClusters': 0, 'memoriesMerged': 0}
+    matrix = await asyncio.to_thread(generate_embeddings, [text for _, text in entries], 'RETRIEVAL_DOCUMENT')
+
+    writer = _BatchWriter()
+    written = 0
+    merged_count = 0
+    for (cluster, text), vector in zip(entries, matrix):
+        if not np.any(vector):
+            continue
+        newest = cluster[-1]['data']
+        await writer.reserve(len(cluster) + 1)
+        await writer.set(db.collection('memories').document(), {
+            'appName': newest.get('appName'),
+            'userId': newest.get('userId'),
+            'scopeKey': newest['scopeKey'],
+            'content': text,
+            'embedding': Vector(vector.tolist()),
+            'timestamp': newest.get('timestamp') or '',
+            'createdAt': cluster[-1]['createdAt'],
+            'consolidatedCount': sum(int(item['data'].get('consolidatedCount') or 1) for item in cluster),
+        })
+        for item in cluster:
+            await writer.delete(item['ref'])
+        written += 1
+        merged_count += len(cluster)
+    await writer.flush()
+    return {'memoryClusters': written, 'memoriesMerged': merged_count}
+
+
+async def run_maintenance() -> Dict[str, Any]:
+    limit = config.MAINTENANCE_SCAN_LIMIT or 5000
+    result: Dict[str, Any] = {}
+    ttl_days = config.SESSION_TTL_DAYS or 0
+    if ttl_days > 0:
+        result.update(await delete_idle_sessions(ttl_days, limit=limit))
+    after_days = config.MEMORY_CONSOLIDATE_AFTER_DAYS or 0
+    if after_days > 0:
+        result.update(await consolidate_memories(after_days, config.MEMORY_CONSOLIDATE_THRESHOLD or 0.85, limit=limit))
+    print(f'[Maintenance] {result}')
+    return result
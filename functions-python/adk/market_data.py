@@ -0,0 +1,415 @@
+"""Price history access for TradeSync ADK (Python).
+
+Bars are served from the local OHLCV store; only the missing tail is fetched
+from Binance or Yahoo Finance.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+import yfinance as yf
+
+from . import config
+from .price_store import PriceStore, normalize_bars
+from .singleflight import SingleFlight
+
+SOURCE_INTERVALS = {'binance': '1h', 'yahoo': '1d'}
+_BINANCE_INTERVAL_SECONDS = 3600
+_BINANCE_MAX_LIMIT = 1000
+
+price_store = PriceStore(config.PRICE_STORE_DIR or '/tmp/tradesync_prices')
+_fetch_flight = SingleFlight[Any]()
+# Earliest start requested per store key, synced by the next flight for that key.
+_sync_starts: Dict[str, int] = {}
+_sync_starts_lock = threading.Lock()
+
+
+def normalize_symbol(raw: str) -> str:
+    return raw.strip().upper().replace(' ', '')
+
+
+def _is_likely_forex(symbol: str) -> bool:
+    return symbol.isalpha() and len(symbol) == 6
+
+
+def to_yahoo_symbol(symbol: str) -> str:
+    cleaned = normalize_symbol(symbol).replace('CRYPTO:', '')
+    if cleaned.endswith('USDT'):
+        return f"{cleaned.replace('USDT', '')}-USD"
+    if cleaned in {'BTC', 'ETH', 'SOL', 'XRP', 'ADA'}:
+        return f"{cleaned}-USD"
+    if _is_likely_forex(cleaned):
+        return f"{cleaned}=X"
+    return cleaned
+
+
+def to_binance_pair(symbol: str) -> str:
+    cleaned = normalize_symbol(symbol).replace('CRYPTO:', '')
+    if '/' in cleaned:
+        return cleaned.replace('/', '')
+    if cleaned.endswith('USDT'):
+        return cleaned
+    return f"{cleaned}USDT"
+
+
+def price_sources(symbol: str) -> List[str]:
+    normalized = normalize_symbol(symbol)
+    if normalized.startswith('CRYPTO:') or normalized.endswith('USDT'):
+        return ['binance', 'yahoo']
+    return ['yahoo', 'binance']
+
+
+def _download_binance(pair: str, start: int) -> Dict[str, List[Any]]:
+    limit = min(_BINANCE_MAX_LIMIT, max(1, (int(time.time()) - start) // _BINANCE_INTERVAL_SECONDS + 1))
+    resp = requests.get(
+        'https://api.binance.com/api/v3/klines',
+        params={'symbol': pair, 'interval': SOURCE_INTERVALS['binance'], 'startTime': start * 1000, 'limit': limit},
+        timeout=20,
+    )
+    resp.raise_for_status()
+    data = resp.json()
+    return {
+        'timestamp': [int(item[0]) // 1000 for item in data],
+        'open': [float(item[1]) for item in data],
+        'high': [float(item[2]) for item in data],
+        'low': [float(item[3]) for item in data],
+        'close': [float(item[4]) for item in data],
+        'volume': [float(item[5]) for item in data],
+    }
+
+
+def _yahoo_download(tickers: str | List[str], interval: str, start: int):
+    data = yf.download(
+        tickers,
+        start=datetime.fromtimestamp(start, timezone.utc),
+        end=datetime.now(timezone.utc),
+        interval=interval,
+        group_by='ticker' if isinstance(tickers, list) else 'column',
+        threads=True,
+        progress=False,
+    )
+    if data is not None and not isinstance(tickers, list) and isinstance(data.columns, pd.MultiIndex):
+        data.columns = data.columns.get_level_values(0)
+    return data
+
+
+def _frame_to_bars(ticker: str, data) -> Dict[str, List[Any]]:
+    if data is None or data.empty or 'Close' not in data.columns:
+        raise RuntimeError(f"Yahoo Finance has no data for {ticker}")
+    data = data.dropna(subset=['Close'])
+    if data.empty:
+        raise RuntimeError(f"Yahoo Finance has no data for {ticker}")
+    close = data['Close']
+    return {
+        'timestamp': [int(index.timestamp()) for index in data.index],
+        'open': data['Open'].fillna(close).tolist() if 'Open' in data.columns else close.tolist(),
+        'high': data['High'].fillna(close).tolist(),
+        'low': data['Low'].fillna(close).tolist(),
+        'close': close.tolist(),
+        'volume': data['Volume'].fillna(0).tolist() if 'Volume' in data.columns else [0.0] * len(close),
+    }
+
+
+def _download_yahoo(ticker: str, interval: str, start: int) -> Dict[str, List[Any]]:
+    return _frame_to_bars(ticker, _yahoo_download(ticker, interval, start))
+
+
+def _plan_sync(source: str, interval: str, key: str, start: int) -> Optional[Tuple[int, bool]]:
+    """Returns ``(download_from, replace)`` or None when the stored bars are fresh enough."""
+    meta = price_store.meta(source, interval, key)
+    last = price_store.last_timestamp(source, interval, key)
+    covered_from = meta.get('coveredFrom')
+    if last is None or covered_from is None or covered_from > start or last < start:
+        return start, True
+    if time.time() - float(meta.get('fetchedAt') or 0) < (config.PRICE_STORE_REFRESH_SECONDS or 60):
+        return None
+    # Re-download from the last stored bar so an open candle gets its final values.
+    return last, False
+
+
+def _apply_sync(source: str, interval: str, key: str, bars: Dict[str, List[Any]], start: int, replace: bool) -> None:
+    now = time.time()
+    if replace:
+        price_store.replace(source, interval, key, bars)
+        price_store.update_meta(source, interval, key, fetchedAt=now, coveredFrom=start)
+    else:
+        price_store.append(source, interval, key, bars)
+        price_store.update_meta(source, interval, key, fetchedAt=now)
+
+
+def _sync_store(source: str, interval: str, key: str, start: int, download: Callable[[int], Dict[str, List[Any]]]) -> None:
+    plan = _plan_sync(source, interval, key, start)
+    if not plan:
+        return
+    download_from, replace = plan
+    try:
+        _apply_sync(source, interval, key, download(download_from), start, replace)
+    except Exception as exc:
+        if replace:
+            raise
+        print(f'[PriceStore] Refresh failed for {source}:{key}, serving stored bars: {exc}')
+
+
+def load_bars(
+    source: str,
+    interval: str,
+    key: str,
+    start: int,
+    download: Callable[[int], Dict[str, List[Any]]],
+) -> Dict[str, np.ndarray]:
+    """Returns bars from ``start`` (epoch seconds), downloading only what the local store is missing.
+
+    Concurrent requests for the same series share one store sync, made from the
+    earliest start any of them asked for; each then reads its own window.
+    """
+    if not config.PRICE_STORE_ENABLED:
+        return _fetch_flight.do(f'{source}:{interval}:{key}:{start}', lambda: normalize_bars(download(start)))
+
+    flight_key = f'{source}:{interval}:{key}'
+
+    def sync() -> None:
+        with _sync_starts_lock:
+            widest = _sync_starts.pop(flight_key, start)
+        _sync_store(source, interval, key, min(widest, start), download)
+
+    for _ in range(2):
+        with _sync_starts_lock:
+            _sync_starts[flight_key] = min(start, _sync_starts.get(flight_key, start))
+        _fetch_flight.do(flight_key, sync)
+        covered_from = price_store.meta(source, interval, key).get('coveredFrom')
+        # A flight that was already running when this call joined may have synced a narrower window.
+        if covered_from is not None and covered_from <= start:
+            break
+    return price_store.read(source, interval, key, start=start)
+
+
+def _bars_to_series(symbol: str, source: str, bars: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    closes = bars['close'].tolist()
+    return {
+        'symbol': symbol,
+        'source': source,
+        'interval': SOURCE_INTERVALS[source],
+        'timestamps': bars['timestamp'].tolist(),
+        'prices': closes,
+        'highs': bars['high'].tolist(),
+        'lows': bars['low'].tolist(),
+        'closes': closes,
+        'volumes': bars['volume'].tolist(),
+    }
+
+
+def fetch_binance_series(symbol: str, limit: int = 60) -> Dict[str, Any]:
+    pair = to_binance_pair(symbol)
+    open_time = int(time.time()) // _BINANCE_INTERVAL_SECONDS * _BINANCE_INTERVAL_SECONDS
+    start = open_time - (limit - 1) * _BINANCE_INTERVAL_SECONDS
+    bars = load_bars('binance', SOURCE_INTERVALS['binance'], pair, start, lambda since: _download_binance(pair, since))
+    if not bars['close'].size:
+        raise RuntimeError(f"Binance has no data for {pair}")
+    bars = {name: column[-limit:] for name, column in bars.items()}
+    return _bars_to_series(symbol, 'binance', bars)
+
+
+def _yahoo_start(days: int) -> int:
+    start = datetime.now(timezone.utc) - timedelta(days=days)
+    return int(start.replace(hour=0, minute=0, second=0, microsecond=0).timestamp())
+
+
+def fetch_yahoo_series(symbol: str, days: int = 90) -> Dict[str, Any]:
+    ticker = to_yahoo_symbol(symbol)
+    interval = SOURCE_INTERVALS['yahoo']
+    bars = load_bars('yahoo', interval, ticker, _yahoo_start(days), lambda since: _download_yahoo(ticker, interval, since))
+    if not bars['close'].size:
+        raise RuntimeError(f"Yahoo Finance has no data for {ticker}")
+    return _bars_to_series(symbol, 'yahoo', bars)
+
+
+def fetch_yahoo_batch(symbols: List[str], days: int = 90) -> Dict[str, Dict[str, Any] | Exception]:
+    """Serves many equities from the store, refreshing all stale ones in a single yfinance call."""
+    interval = SOURCE_INTERVALS['yahoo']
+    start = _yahoo_start(days)
+    tickers = {symbol: to_yahoo_symbol(symbol) for symbol in symbols}
+
+    plans: Dict[str, Tuple[int, bool]] = {}
+    if config.PRICE_STORE_ENABLED:
+        for ticker in set(tickers.values()):
+            plan = _plan_sync('yahoo', interval, ticker, start)
+            if plan:
+                plans[ticker] = plan
+    else:
+        plans = {ticker: (start, True) for ticker in set(tickers.values())}
+
+    downloaded: Dict[str, Dict[str, List[Any]] | Exception] = {}
+    if plans:
+        stale = sorted(plans)
+        data = _yahoo_download(stale, interval, min(plan[0] for plan in plans.values()))
+        available = set(data.columns.get_level_values(0)) if data is not None and isinstance(data.columns, pd.MultiIndex) else set()
+        for ticker in stale:
+            try:
+                frame = data[ticker] if ticker in available else None
+                downloaded[ticker] = _frame_to_bars(ticker, frame)
+            except Exception as exc:
+                downloaded[ticker] = exc
+
+    failures: Dict[str, Exception] = {}
+    for ticker, bars in downloaded.items():
+        if not config.PRICE_STORE_ENABLED:
+            continue
+        if isinstance(bars, Exception):
+            if plans[ticker][1]:
+                failures[ticker] = bars
+            else:
+                print(f'[PriceStore] Refresh failed for yahoo:{ticker}, serving stored bars: {bars}')
+            continue
+        _apply_sync('yahoo', interval, ticker, bars, start, plans[ticker][1])
+
+    results: Dict[str, Dict[str, Any] | Exception] = {}
+    for symbol, ticker in tickers.items():
+        try:
+            if ticker in failures:
+                raise failures[ticker]
+            if config.PRICE_STORE_ENABLED:
+                bars = price_store.read('yahoo', interval, ticker, start=start)
+            else:
+                raw = downloaded[ticker]
+                if isinstance(raw, Exception):
+                    raise raw
+                bars = normalize_bars(raw)
+            if not bars['close'].size:
+                raise RuntimeError(f"Yahoo Finance has no data for {ticker}")
+            results[symbol] = _bars_to_series(symbol, 'yahoo', bars)
+        except Exception as exc:
+            results[symbol] = exc
+    return results
+
+
+SERIES_FETCHERS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    'binance': fetch_binance_series,
+    'yahoo': fetch_yahoo_series,
+}
+
+
+def fetch_price_series(symbol: str) -> Dict[str, Any]:
+    primary, fallback = price_sources(symbol)
+    try:
+        return SERIES_FETCHERS[primary](symbol)
+    except Exception:
+        return SERIES_FETCHERS[fallback](symbol)
+
+
+def fetch_price_series_batch(symbols: List[str]) -> Dict[str, Dict[str, Any] | Exception]:
+    by_source: Dict[str, List[str]] = {'binance': [], 'yahoo': []}
+    for symbol in symbols:
+        by_source[price_sources(symbol)[0]].append(symbol)
+
+    workers = max(1, config.MARKET_DATA_MAX_WORKERS or 8)
+
+    def fetch_binance(batch: List[str]) -> Dict[str, Dict[str, Any] | Exception]:
+        results: Dict[str, Dict[str, Any] | Exception] = {}
+        if not batch:
+            return results
+        with ThreadPoolExecutor(max_workers=min(workers, len(batch))) as pool:
+            futures = {symbol: pool.submit(fetch_binance_series, symbol) for symbol in batch}
+            for symbol, future in futures.items():
+                try:
+                    results[symbol] = future.result()
+                except Exception as exc:
+                    results[symbol] = exc
+        return results
+
+    def fetch_yahoo(batch: List[str]) -> Dict[str, Dict[str, Any] | Exception]:
+        if not batch:
+            return {}
+        try:
+            return fetch_yahoo_batch(batch)
+        except Exception as exc:
+            return {symbol: exc for symbol in batch}
+
+    fetchers = {'binance': fetch_binance, 'yahoo': fetch_yahoo}
+    results = {**fetch_binance(by_source['binance']), **fetch_yahoo(by_source['yahoo'])}
+
+    retry: Dict[str, List[str]] = {'binance': [], 'yahoo': []}
+    for symbol, result in results.items():
+        if isinstance(result, Exception):
+            retry[price_sources(symbol)[1]].append(symbol)
+    for source, batch in retry.items():
+        for symbol, result in fetchers[source](batch).items():
+            if not isinstance(result, Exception):
+                results[symbol] = result
+    return results
+
+
+def _period_start(period: str) -> Optional[Tuple[int, Optional[int]]]:
+    """``(start, trading_days)`` for a yfinance period; ``Nd`` periods count trading days, as yfinance does."""
+    now = datetime.now(timezone.utc)
+    normalized = (period or '').strip().lower()
+    if normalized == 'ytd':
+        return int(datetime(now.year, 1, 1, tzinfo=timezone.utc).timestamp()), None
+    match = re.fullmatch(r'(\d+)(d|wk|mo|y)', normalized)
+    if not match:
+        return None
+    amount = int(match.group(1))
+    if match.group(2) == 'd':
+        # Wide enough to hold ``amount`` sessions across weekends and holidays; trimmed after loading.
+        return _yahoo_start(amount * 2 + 4), amount
+    days = {'wk': 7, 'mo': 31, 'y': 366}[match.group(2)] * amount
+    return _yahoo_start(days), None
+
+
+def _empty_frame() -> pd.DataFrame:
+    return pd.DataFrame(
+        columns=['Open', 'High', 'Low', 'Close', 'Volume'],
+        index=pd.DatetimeIndex([], name='Date'),
+    )
+
+
+def load_yahoo_frame(ticker: str, interval: str, period: str) -> Optional[pd.DataFrame]:
+    """OHLCV frame for a raw Yahoo ticker, or None when ``period`` cannot be served from the store.
+
+    Unknown tickers give an empty frame. Intraday bars keep the exchange timezone
+    yfinance reports, recorded in the store metadata on download.
+    """
+    window = _period_start(period)
+    if window is None:
+        return None
+    start, trading_days = window
+    timezones: List[str] = []
+
+    def download(since: int) -> Dict[str, List[Any]]:
+        data = _yahoo_download(ticker, interval, since)
+        tz = getattr(getattr(data, 'index', None), 'tz', None)
+        if tz is not None:
+            timezones.append(str(tz))
+            price_store.update_meta('yahoo', interval, ticker, tz=str(tz))
+        return _frame_to_bars(ticker, data)
+
+    try:
+        bars = load_bars('yahoo', interval, ticker, start, download)
+    except RuntimeError:
+        return _empty_frame()
+    index = pd.to_datetime(np.asarray(bars['timestamp']), unit='s')
+    tz = timezones[-1] if timezones else price_store.meta('yahoo', interval, ticker).get('tz')
+    if tz:
+        index = index.tz_localize('UTC').tz_convert(tz)
+    frame = pd.DataFrame(
+        {
+            'Open': np.asarray(bars['open']),
+            'High': np.asarray(bars['high']),
+            'Low': np.asarray(bars['low']),
+            'Close': np.asarray(bars['close']),
+            'Volume': np.asarray(bars['volume']),
+        },
+        index=pd.DatetimeIndex(index, name='Date'),
+    )
+    if trading_days is not None and not frame.empty:
+        sessions = frame.index.normalize().unique()
+        frame = frame[frame.index >= sessions[-trading_days:][0]]
+    return frame
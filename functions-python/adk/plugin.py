@@ -146,6 +146,15 @@ class TradeSyncPlugin(BasePlugin):
             f"Tools: {self._metrics['tool_calls']}"
         )
 
+        try:
+            await self._maybe_save_memory(invocation_context)
+        finally:
+            session = invocation_context.session
+            service = invocation_context.session_service
+            if session and hasattr(service, 'flush_state'):
+                await service.flush_state(session.id)
+
+    async def _maybe_save_memory(self, invocation_context) -> None:
         session = invocation_context.session
         memory_service = invocation_context.memory_service
         memory_every = config.MEMORY_SAVE_EVERY_EVENTS or 6
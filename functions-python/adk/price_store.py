@@ -0,0 +1,190 @@
+"""Local columnar OHLCV store backed by memory-mapped NumPy files.
+
+Each ``source/interval/symbol`` key is a directory with one raw little-endian
+file per column. New bars are appended to the tail; a bar with the same
+timestamp as the last stored one overwrites it in place.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+COLUMNS = (
+    ('timestamp', np.dtype('<i8')),
+    ('open', np.dtype('<f8')),
+    ('high', np.dtype('<f8')),
+    ('low', np.dtype('<f8')),
+    ('close', np.dtype('<f8')),
+    ('volume', np.dtype('<f8')),
+)
+
+
+def _empty_bars() -> Dict[str, np.ndarray]:
+    return {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS}
+
+
+def normalize_bars(bars: Dict[str, Sequence[Any]]) -> Dict[str, np.ndarray]:
+    """Column arrays sorted by timestamp, keeping the last of any duplicate timestamps."""
+    timestamps = np.asarray(bars.get('timestamp', []), dtype=np.int64)
+    if not timestamps.size:
+        return _empty_bars()
+    closes = np.asarray(bars['close'], dtype=np.float64)
+    columns = {'timestamp': timestamps, 'close': closes}
+    for name, dtype in COLUMNS:
+        if name in columns:
+            continue
+        values = bars.get(name)
+        if values is None:
+            fallback = np.zeros_like(closes) if name == 'volume' else closes
+            columns[name] = fallback.astype(dtype)
+        else:
+            columns[name] = np.asarray(values, dtype=dtype)
+
+    order = np.argsort(timestamps, kind='stable')
+    reversed_ts = timestamps[order][::-1]
+    _, first_in_reversed = np.unique(reversed_ts, return_index=True)
+    keep = order[::-1][first_in_reversed]
+    return {name: np.ascontiguousarray(columns[name][keep].astype(dtype)) for name, dtype in COLUMNS}
+
+
+class PriceStore:
+    def __init__(self, root: str) -> None:
+        self._root = root
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def _path(self, source: str, interval: str, symbol: str) -> str:
+        safe_symbol = re.sub(r'[^A-Za-z0-9._=^-]', '_', symbol.upper())
+        return os.path.join(self._root, source, interval, safe_symbol)
+
+    def _lock(self, path: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(path)
+            if lock is None:
+                lock = self._locks[path] = threading.Lock()
+            return lock
+
+    @staticmethod
+    def _column_file(path: str, name: str) -> str:
+        return os.path.join(path, f'{name}.bin')
+
+    def _rows(self, path: str) -> int:
+        # Columns are written one after another, so a partially written append is
+        # ignored by trusting the shortest column.
+        rows = None
+        for name, dtype in COLUMNS:
+            try:
+                count = os.path.getsize(self._column_file(path, name)) // dtype.itemsize
+            except OSError:
+                return 0
+            rows = count if rows is None else min(rows, count)
+        return rows or 0
+
+    def _map(self, path: str, rows: int) -> Dict[str, np.ndarray]:
+        if rows <= 0:
+            return _empty_bars()
+        return {
+            name: np.memmap(self._column_file(path, name), dtype=dtype, mode='r', shape=(rows,))
+            for name, dtype in COLUMNS
+        }
+
+    def read(
+        self,
+        source: str,
+        interval: str,
+        symbol: str,
+        *,
+        start: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> Dict[str, np.ndarray]:
+        """Returns read-only column views, optionally from ``start`` (epoch seconds) and/or the last ``limit`` rows."""
+        path = self._path(source, interval, symbol)
+        with self._lock(path):
+            rows = self._rows(path)
+            columns = self._map(path, rows)
+        begin = 0
+        if start is not None and rows:
+            begin = int(np.searchsorted(columns['timestamp'], start, side='left'))
+        if limit is not None and limit > 0:
+            begin = max(begin, rows - limit)
+        return {name: column[begin:] for name, column in columns.items()}
+
+    def last_timestamp(self, source: str, interval: str, symbol: str) -> Optional[int]:
+        timestamps = self.read(source, interval, symbol, limit=1)['timestamp']
+        return int(timestamps[-1]) if timestamps.size else None
+
+    def append(self, source: str, interval: str, symbol: str, bars: Dict[str, Sequence[Any]]) -> int:
+        """Merges ``bars`` into the tail of the store and returns the number of rows appended."""
+        incoming = normalize_bars(bars)
+        if not incoming['timestamp'].size:
+            return 0
+
+        path = self._path(source, interval, symbol)
+        with self._lock(path):
+            os.makedirs(path, exist_ok=True)
+            rows = self._rows(path)
+            last = None
+            if rows:
+                last = int(self._map(path, rows)['timestamp'][-1])
+
+            if last is not None:
+                same = incoming['timestamp'] == last
+                if same.any():
+                    index = int(np.flatnonzero(same)[-1])
+                    for name, dtype in COLUMNS:
+                        with open(self._column_file(path, name), 'r+b') as handle:
+                            handle.seek((rows - 1) * dtype.itemsize)
+                            handle.write(incoming[name][index : index + 1].tobytes())
+                newer = incoming['timestamp'] > last
+                incoming = {name: column[newer] for name, column in incoming.items()}
+
+            appended = int(incoming['timestamp'].size)
+            if appended:
+                for name, dtype in COLUMNS:
+                    with open(self._column_file(path, name), 'r+b' if rows else 'wb') as handle:
+                        handle.truncate(rows * dtype.itemsize)
+                        handle.seek(rows * dtype.itemsize)
+                        handle.write(incoming[name].tobytes())
+            return appended
+
+    def replace(self, source: str, interval: str, symbol: str, bars: Dict[str, Sequence[Any]]) -> None:
+        incoming = normalize_bars(bars)
+        path = self._path(source, interval, symbol)
+        with self._lock(path):
+            os.makedirs(path, exist_ok=True)
+            for name, _ in COLUMNS:
+                target = self._column_file(path, name)
+                temp = f'{target}.tmp'
+                with open(temp, 'wb') as handle:
+                    handle.write(incoming[name].tobytes())
+                os.replace(temp, target)
+
+    def meta(self, source: str, interval: str, symbol: str) -> Dict[str, Any]:
+        path = os.path.join(self._path(source, interval, symbol), 'meta.json')
+        try:
+            with open(path, 'r', encoding='utf-8') as handle:
+                return json.load(handle)
+        except (OSError, ValueError):
+            return {}
+
+    def update_meta(self, source: str, interval: str, symbol: str, **values: Any) -> None:
+        path = self._path(source, interval, symbol)
+        with self._lock(path):
+            os.makedirs(path, exist_ok=True)
+            meta_path = os.path.join(path, 'meta.json')
+            try:
+                with open(meta_path, 'r', encoding='utf-8') as handle:
+                    meta = json.load(handle)
+            except (OSError, ValueError):
+                meta = {}
+            meta.update(values)
+            temp = f'{meta_path}.tmp'
+            with open(temp, 'w', encoding='utf-8') as handle:
+                json.dump(meta, handle)
+            os.replace(temp, meta_path)
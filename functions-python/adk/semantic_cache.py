@@ -0,0 +1,102 @@
+"""Embedding-similarity cache for paraphrased queries."""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Generic, List, Optional, Sequence, TypeVar
+
+import numpy as np
+
+T = TypeVar('T')
+
+
+class SemanticCache(Generic[T]):
+    """Serves a cached value when a query embedding is close enough to a stored one.
+
+    Entries live in a fixed-size float32 matrix used as a ring buffer, so a lookup
+    is one small matrix-vector product. Entries only match within the same
+    ``namespace`` (e.g. user scope, or result limit plus filters).
+    """
+
+    def __init__(
+        self,
+        *,
+        max_size: int = 512,
+        threshold: float = 0.95,
+        ttl_seconds: int = 600,
+        name: str = 'semantic',
+    ) -> None:
+        self._max_size = max(1, max_size)
+        self._threshold = threshold
+        self._ttl_seconds = max(1, ttl_seconds)
+        self._name = name
+        self._lock = threading.Lock()
+        self._matrix: Optional[np.ndarray] = None
+        self._namespace_hashes = np.zeros(self._max_size, dtype=np.int64)
+        self._expires_at = np.zeros(self._max_size, dtype=np.float64)
+        self._namespaces: List[Optional[str]] = [None] * self._max_size
+        self._values: List[Optional[T]] = [None] * self._max_size
+        self._next = 0
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0}
+
+    @staticmethod
+    def _unit(vector: Sequence[float]) -> Optional[np.ndarray]:
+        values = np.asarray(vector, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(values))
+        return values / norm if norm > 0 else None
+
+    def lookup(self, namespace: str, vector: Sequence[float]) -> Optional[T]:
+        query = self._unit(vector)
+        with self._lock:
+            matrix = self._matrix
+            if query is None or matrix is None or query.shape[0] != matrix.shape[1]:
+                self._stats['misses'] += 1
+                return None
+            rows = np.flatnonzero(
+                (self._expires_at > time.time()) & (self._namespace_hashes == hash(namespace))
+            )
+            rows = [row for row in rows if self._namespaces[row] == namespace]
+            if rows:
+                similarities = matrix[rows] @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self._threshold:
+                    self._stats['hits'] += 1
+                    return self._values[rows[best]]
+            self._stats['misses'] += 1
+            return None
+
+    def store(self, namespace: str, vector: Sequence[float], value: T) -> None:
+        unit = self._unit(vector)
+        if unit is None:
+            return
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != unit.shape[0]:
+                self._matrix = np.zeros((self._max_size, unit.shape[0]), dtype=np.float32)
+                self._expires_at[:] = 0
+            slot = self._next
+            self._next = (slot + 1) % self._max_size
+            self._matrix[slot] = unit
+            self._namespace_hashes[slot] = hash(namespace)
+            self._namespaces[slot] = namespace
+            self._values[slot] = value
+            self._expires_at[slot] = time.time() + self._ttl_seconds
+            self._stats['stores'] += 1
+
+    def invalidate(self, namespace: str) -> None:
+        """Drops every entry stored under ``namespace``."""
+        with self._lock:
+            for row in np.flatnonzero(self._namespace_hashes == hash(namespace)):
+                if self._namespaces[row] == namespace:
+                    self._expires_at[row] = 0
+                    self._values[row] = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return {
+                'name': self._name,
+                'size': int(np.count_nonzero(self._expires_at > time.time())),
+                **self._stats,
+                'hit_ratio': self._stats['hits'] / lookups if lookups else 0.0,
+            }
@@ -2,23 +2,28 @@
 
 from __future__ import annotations
 
+import asyncio
+import functools
 import os
 import random
 import time
-from datetime import datetime, timezone, timedelta
+from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional
 
 import firebase_admin
+import numpy as np
 import requests
-import pandas as pd
-import yfinance as yf
 from firebase_admin import firestore
 from google.adk.tools import FunctionTool
 from google.adk.tools.tool_context import ToolContext
 from youtube_transcript_api import YouTubeTranscriptApi
 
 from . import config
-from .knowledge_service import search_knowledge
+from . import indicators
+from . import market_data
+from .firestore_client import get_async_client
+from .indicator_state import IndicatorState, indicator_states
+from .knowledge_service import KnowledgeFilters, search_knowledge
 
 if not firebase_admin._apps:
     firebase_admin.initialize_app()
@@ -33,146 +38,129 @@ def _ts_functions_base_url() -> Optional[str]:
     return f"https://{config.FUNCTIONS_REGION}-{project}.cloudfunctions.net"
 
 
-def _normalize_symbol(raw: str) -> str:
-    return raw.strip().upper().replace(' ', '')
+# Small overlapping windows used to bring a cached indicator state up to date.
+_TAIL_FETCH_ARGS = {'binance': {'limit': 3}, 'yahoo': {'days': 7}}
 
 
-def _is_likely_forex(symbol: str) -> bool:
-    return symbol.isalpha() and len(symbol) == 6
-
-
-def _to_yahoo_symbol(symbol: str) -> str:
-    cleaned = _normalize_symbol(symbol).replace('CRYPTO:', '')
-    if cleaned.endswith('USDT'):
-        return f"{cleaned.replace('USDT', '')}-USD"
-    if cleaned in {'BTC', 'ETH', 'SOL', 'XRP', 'ADA'}:
-        return f"{cleaned}-USD"
-    if _is_likely_forex(cleaned):
-        return f"{cleaned}=X"
-    return cleaned
-
-
-def _to_binance_pair(symbol: str) -> str:
-    cleaned = _normalize_symbol(symbol).replace('CRYPTO:', '')
-    if '/' in cleaned:
-        return cleaned.replace('/', '')
-    if cleaned.endswith('USDT'):
-        return cleaned
-    return f"{cleaned}USDT"
+def _load_indicator_state(symbol: str) -> IndicatorState:
+    key = market_data.normalize_symbol(symbol)
+    for source in market_data.price_sources(symbol):
+        state = indicator_states.get(key, market_data.SOURCE_INTERVALS[source])
+        if state is None:
+            continue
+        try:
+            tail = market_data.SERIES_FETCHERS[source](symbol, **_TAIL_FETCH_ARGS[source])
+            if state.extend(tail):
+                return state
+        except Exception as exc:
+            print(f'[Indicators] Incremental update failed for {key}: {exc}')
+        break
+
+    state = IndicatorState.from_series(market_data.fetch_price_series(symbol))
+    indicator_states.put(key, state)
+    return state
+
+
+def _series_matrix(batch: List[Dict[str, Any]]) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    closes = np.asarray([series['closes'] for series in batch], dtype=np.float64)
+    highs = np.asarray([series['highs'] for series in batch], dtype=np.float64)
+    lows = np.asarray([series['lows'] for series in batch], dtype=np.float64)
+    volumes = np.asarray(
+        [series['volumes'] if series.get('volumes') is not None else [0.0] * len(series['closes']) for series in batch],
+        dtype=np.float64,
+    )
+    return closes, highs, lows, volumes
 
 
-def _fetch_binance_series(symbol: str) -> Dict[str, Any]:
-    pair = _to_binance_pair(symbol)
-    url = f"https://api.binance.com/api/v3/klines?symbol={pair}&interval=1h&limit=60"
-    resp = requests.get(url, timeout=20)
-    resp.raise_for_status()
-    data = resp.json()
-    closes = [float(item[4]) for item in data]
-    highs = [float(item[2]) for item in data]
-    lows = [float(item[3]) for item in data]
+def _latest_indicators(closes: np.ndarray, highs: np.ndarray, lows: np.ndarray, volumes: np.ndarray) -> Dict[str, np.ndarray]:
+    rows = closes.shape[0]
+    has_macd = closes.shape[-1] >= 26
+    macd_line, macd_signal, macd_hist = indicators.macd(closes)
+    bb_mid, bb_upper, bb_lower = indicators.bollinger(closes)
+    stoch_k, stoch_d = indicators.stochastic(highs, lows, closes)
+    adx_values, plus_di, minus_di = indicators.adx(highs, lows, closes)
     return {
-        'symbol': symbol,
-        'source': 'binance',
-        'interval': '1h',
-        'prices': closes,
-        'highs': highs,
-        'lows': lows,
-        'closes': closes,
+        'rsi': indicators.last(indicators.rsi(closes), 50.0),
+        'macd': indicators.last(macd_line) if has_macd else np.zeros(rows),
+        'macdSignal': indicators.last(macd_signal) if has_macd else np.zeros(rows),
+        'macdHistogram': indicators.last(macd_hist) if has_macd else np.zeros(rows),
+        'bbMiddle': indicators.last(bb_mid, np.nan),
+        'bbUpper': indicators.last(bb_upper, np.nan),
+        'bbLower': indicators.last(bb_lower, np.nan),
+        'atr': indicators.last(indicators.atr(highs, lows, closes), np.nan),
+        'stochK': indicators.last(stoch_k, np.nan),
+        'stochD': indicators.last(stoch_d, np.nan),
+        'adx': indicators.last(adx_values, np.nan),
+        'plusDI': indicators.last(plus_di, np.nan),
+        'minusDI': indicators.last(minus_di, np.nan),
+        'obv': indicators.last(indicators.obv(closes, volumes)),
+        'vwap': indicators.last(indicators.vwap(highs, lows, closes, volumes), np.nan),
     }
 
 
-def _fetch_yahoo_series(symbol: str) -> Dict[str, Any]:
-    yahoo_symbol = _to_yahoo_symbol(symbol)
-    period2 = datetime.now(timezone.utc)
-    period1 = period2 - timedelta(days=90)
-    data = yf.download(yahoo_symbol, start=period1, end=period2, interval='1d', progress=False)
-
-    if data is None or data.empty:
-        raise RuntimeError(f"Yahoo Finance has no data for {yahoo_symbol}")
-
-    if isinstance(data.columns, pd.MultiIndex):
-        data.columns = data.columns.get_level_values(0)
-
-    closes = data['Close'].dropna().tolist()
-    highs = data['High'].fillna(data['Close']).tolist()
-    lows = data['Low'].fillna(data['Close']).tolist()
+def _snapshot_row(latest: Dict[str, np.ndarray], row: int, state: Optional[IndicatorState] = None) -> Dict[str, Any]:
+    def value(name: str, fallback: Optional[float] = None) -> Optional[float]:
+        number = float(latest[name][row])
+        return number if np.isfinite(number) else fallback
 
     return {
-        'symbol': symbol,
-        'source': 'yahoo',
-        'interval': '1d',
-        'prices': closes,
-        'highs': highs,
-        'lows': lows,
-        'closes': closes,
+        'rsi': state.rsi if state else value('rsi'),
+        'macd': state.macd if state else {
+            'value': value('macd'),
+            'signal': value('macdSignal'),
+            'histogram': value('macdHistogram'),
+        },
+        'bollinger': {
+            'middle': value('bbMiddle'),
+            'upper': value('bbUpper'),
+            'lower': value('bbLower'),
+        },
+        'atr': value('atr'),
+        'stochastic': {
+            'k': value('stochK'),
+            'd': value('stochD'),
+        },
+        'adx': {
+            'value': value('adx'),
+            'plusDI': value('plusDI'),
+            'minusDI': value('minusDI'),
+        },
+        'obv': value('obv', 0.0),
+        'vwap': value('vwap'),
     }
 
 
-def _fetch_price_series(symbol: str) -> Dict[str, Any]:
-    normalized = _normalize_symbol(symbol)
-    if normalized.startswith('CRYPTO:') or normalized.endswith('USDT'):
-        try:
-            return _fetch_binance_series(symbol)
-        except Exception:
-            return _fetch_yahoo_series(symbol)
+def _indicator_snapshot(series: Dict[str, Any], state: Optional[IndicatorState] = None) -> Dict[str, Any]:
+    return _snapshot_row(_latest_indicators(*_series_matrix([series])), 0, state)
 
-    try:
-        return _fetch_yahoo_series(symbol)
-    except Exception:
-        return _fetch_binance_series(symbol)
-
-
-def _ema(values: List[float], period: int) -> List[float]:
-    if not values:
-        return []
-    k = 2 / (period + 1)
-    ema_values = []
-    ema = values[0]
-    for value in values:
-        ema = value * k + ema * (1 - k)
-        ema_values.append(ema)
-    return ema_values
-
-
-def _calculate_rsi(prices: List[float], period: int = 14) -> float:
-    if len(prices) < period + 1:
-        return 50.0
-    gains = 0.0
-    losses = 0.0
-    for i in range(len(prices) - period, len(prices)):
-        change = prices[i] - prices[i - 1]
-        if change > 0:
-            gains += change
-        else:
-            losses -= change
-    avg_gain = gains / period
-    avg_loss = losses / period
-    if avg_loss == 0:
-        return 100.0
-    rs = avg_gain / avg_loss
-    return 100 - (100 / (1 + rs))
-
-
-def _calculate_macd(prices: List[float]) -> Dict[str, float]:
-    if len(prices) < 26:
-        return {'value': 0.0, 'signal': 0.0, 'histogram': 0.0}
-    ema_fast = _ema(prices, 12)
-    ema_slow = _ema(prices, 26)
-    macd_line = [fast - slow for fast, slow in zip(ema_fast, ema_slow)]
-    signal_line = _ema(macd_line, 9)
-    histogram = macd_line[-1] - signal_line[-1]
+
+def _analysis_payload(symbol: str, series: Dict[str, Any], snapshot: Dict[str, Any]) -> Dict[str, Any]:
+    closes = series['closes']
+    current_price = closes[-1]
+    avg_price = sum(closes) / len(closes)
+    trend = 'bullish' if current_price > avg_price else 'bearish' if current_price < avg_price else 'neutral'
+    volatility = max(closes) - min(closes)
     return {
-        'value': macd_line[-1],
-        'signal': signal_line[-1],
-        'histogram': histogram,
+        'symbol': symbol,
+        'source': series['source'],
+        'interval': series['interval'],
+        'currentPrice': current_price,
+        'avgPrice': f"{avg_price:.2f}",
+        'trend': trend,
+        'volatility': f"{volatility:.2f}",
+        'priceCount': len(closes),
+        'prices': closes[-10:],
+        'highs': series['highs'][-10:],
+        'lows': series['lows'][-10:],
+        'closes': closes[-10:],
+        **snapshot,
     }
 
 
-def get_latest_market_signals() -> List[Dict[str, Any]] | Dict[str, Any]:
+async def get_latest_market_signals() -> List[Dict[str, Any]] | Dict[str, Any]:
     """Retrieves the 10 most recent market scan signals including buy/sell recommendations."""
-    db = firestore.client()
-    query = db.collection('signals').order_by('createdAt', direction=firestore.Query.DESCENDING).limit(10)
-    docs = query.get()
+    query = get_async_client().collection('signals').order_by('createdAt', direction=firestore.Query.DESCENDING).limit(10)
+    docs = await query.get()
     if not docs:
         return {'message': 'No recent market signals found.'}
 
@@ -199,36 +187,54 @@ def get_latest_market_signals() -> List[Dict[str, Any]] | Dict[str, Any]:
 
 
 def technical_analysis(symbol: str) -> Dict[str, Any]:
-    """Runs technical analysis on any asset (price trend, volatility, RSI, MACD)."""
+    """Runs technical analysis on any asset (price trend, volatility, RSI, MACD, Bollinger, ATR, Stochastic, ADX, OBV, VWAP)."""
     try:
-        series = _fetch_price_series(symbol)
-        closes = series['closes']
-        current_price = closes[-1]
-        avg_price = sum(closes) / len(closes)
-        trend = 'bullish' if current_price > avg_price else 'bearish' if current_price < avg_price else 'neutral'
-        volatility = max(closes) - min(closes)
-        rsi = _calculate_rsi(closes)
-        macd = _calculate_macd(closes)
-        return {
-            'symbol': symbol,
-            'source': series['source'],
-            'interval': series['interval'],
-            'currentPrice': current_price,
-            'avgPrice': f"{avg_price:.2f}",
-            'trend': trend,
-            'volatility': f"{volatility:.2f}",
-            'priceCount': len(closes),
-            'prices': closes[-10:],
-            'highs': series['highs'][-10:],
-            'lows': series['lows'][-10:],
-            'closes': closes[-10:],
-            'rsi': rsi,
-            'macd': macd,
-        }
+        state = _load_indicator_state(symbol)
+        series = state.series()
+        return _analysis_payload(symbol, series, _indicator_snapshot(series, state))
     except Exception as exc:
         return {'error': True, 'symbol': symbol, 'message': str(exc)}
 
 
+def technical_analysis_batch(symbols: List[str]) -> Dict[str, Any]:
+    """Runs technical analysis on several assets at once. Use this instead of repeated technical_analysis calls."""
+    unique: List[str] = []
+    for symbol in symbols or []:
+        if symbol and symbol.strip() and symbol not in unique:
+            unique.append(symbol)
+    limit = config.TECHNICAL_BATCH_MAX or 50
+    skipped = unique[limit:]
+    unique = unique[:limit]
+
+    fetched = market_data.fetch_price_series_batch(unique)
+    results: Dict[str, Dict[str, Any]] = {}
+
+    # One vectorized pass per distinct series length.
+    groups: Dict[int, List[str]] = {}
+    for symbol in unique:
+        series = fetched.get(symbol)
+        if isinstance(series, dict) and series.get('closes'):
+            groups.setdefault(len(series['closes']), []).append(symbol)
+        else:
+            message = str(series) if isinstance(series, Exception) else 'No price data available.'
+            results[symbol] = {'error': True, 'symbol': symbol, 'message': message}
+
+    for members in groups.values():
+        batch = [fetched[symbol] for symbol in members]
+        try:
+            latest = _latest_indicators(*_series_matrix(batch))
+            for row, symbol in enumerate(members):
+                results[symbol] = _analysis_payload(symbol, fetched[symbol], _snapshot_row(latest, row))
+        except Exception as exc:
+            for symbol in members:
+                results[symbol] = {'error': True, 'symbol': symbol, 'message': str(exc)}
+
+    for symbol in skipped:
+        results[symbol] = {'error': True, 'symbol': symbol, 'message': f'Batch limit of {limit} symbols exceeded.'}
+
+    return {'results': [results[symbol] for symbol in unique + skipped]}
+
+
 def get_market_news(tickers: str) -> List[Dict[str, Any]] | Dict[str, Any]:
     """Fetches news for global assets (Stocks, Crypto, Forex)."""
     base_url = _ts_functions_base_url()
@@ -260,24 +266,19 @@ def get_market_news(tickers: str) -> List[Dict[str, Any]] | Dict[str, Any]:
 
 def calculate_signal(symbol: str, sentiment_score: float, rsi: float, macd_histogram: float) -> Dict[str, Any]:
     """Calculates trading signal based on technical indicators (RSI, MACD) and sentiment."""
-    score = 0.0
+    score = float(indicators.signal_score(rsi, macd_histogram, sentiment_score))
     reasons = []
 
     if rsi < 30:
-        score += 25
         reasons.append(f"RSI oversold ({rsi:.1f})")
     elif rsi > 70:
-        score -= 25
         reasons.append(f"RSI overbought ({rsi:.1f})")
 
     if macd_histogram > 0:
-        score += 25
         reasons.append('MACD bullish')
     elif macd_histogram < 0:
-        score -= 25
         reasons.append('MACD bearish')
 
-    score += sentiment_score * 50
     if sentiment_score > 0.5:
         reasons.append('Strong positive sentiment')
     elif sentiment_score < -0.5:
@@ -303,9 +304,27 @@ def calculate_signal(symbol: str, sentiment_score: float, rsi: float, macd_histo
     }
 
 
-def search_knowledge_base(query: str) -> Dict[str, Any]:
-    """Searches the RAG knowledge base for trading books, financial reports, and academic papers."""
-    results = search_knowledge(query, 3)
+def search_knowledge_base(
+    query: str,
+    source_type: str = '',
+    title: str = '',
+    page_from: int = 0,
+    page_to: int = 0,
+    max_age_days: int = 0,
+) -> Dict[str, Any]:
+    """Searches the RAG knowledge base for trading books, financial reports, and academic papers.
+
+    Optional filters: source_type ('books', 'articles', 'pdfs' or 'github'), exact source title,
+    page range (page_from/page_to) and max_age_days for recently ingested documents.
+    """
+    filters = KnowledgeFilters(
+        source_type=source_type or None,
+        title=title or None,
+        page_from=page_from or None,
+        page_to=page_to or None,
+        max_age_days=max_age_days or None,
+    )
+    results = search_knowledge(query, 3, filters)
     if not results:
         return {'found': False, 'message': 'No relevant information found in knowledge base.'}
 
@@ -516,7 +535,7 @@ async def execute_trade(
         'isDryRun': should_dry_run,
     }
 
-    response = requests.post(f"{base_url}/executeTrade", json=payload, timeout=25)
+    response = await asyncio.to_thread(requests.post, f"{base_url}/executeTrade", json=payload, timeout=25)
     if not response.ok:
         return {'success': False, 'status': 'failed', 'message': f"Trade error: {response.status_code}"}
     return response.json()
@@ -593,24 +612,35 @@ def fetch_youtube_transcript(video_url: str) -> Dict[str, Any]:
         return {'error': True, 'message': 'Transcript unavailable for this video', 'videoId': video_id}
 
 
+def _off_loop(func):
+    # Blocking tools run in a worker thread so they do not stall the event loop shared by all requests.
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+    return wrapper
+
+
 # Tool wrappers
 latest_signals_tool = FunctionTool(get_latest_market_signals)
-market_news_tool = FunctionTool(get_market_news)
-technical_analysis_tool = FunctionTool(technical_analysis)
+market_news_tool = FunctionTool(_off_loop(get_market_news))
+technical_analysis_tool = FunctionTool(_off_loop(technical_analysis))
+technical_analysis_batch_tool = FunctionTool(_off_loop(technical_analysis_batch))
 calculate_signal_tool = FunctionTool(calculate_signal)
-knowledge_tool = FunctionTool(search_knowledge_base)
+knowledge_tool = FunctionTool(_off_loop(search_knowledge_base))
 memory_search_tool = FunctionTool(search_memory)
-vertex_search_tool = FunctionTool(vertex_ai_search)
-vertex_rag_tool = FunctionTool(vertex_ai_rag_retrieval)
+vertex_search_tool = FunctionTool(_off_loop(vertex_ai_search))
+vertex_rag_tool = FunctionTool(_off_loop(vertex_ai_rag_retrieval))
 trade_execution_tool = FunctionTool(execute_trade)
 confirm_trade_tool = FunctionTool(confirm_trade)
-chart_tool = FunctionTool(get_chart)
-fetch_transcript_tool = FunctionTool(fetch_youtube_transcript)
+chart_tool = FunctionTool(_off_loop(get_chart))
+fetch_transcript_tool = FunctionTool(_off_loop(fetch_youtube_transcript))
 
 ALL_TOOLS = [
     latest_signals_tool,
     market_news_tool,
     technical_analysis_tool,
+    technical_analysis_batch_tool,
     calculate_signal_tool,
     knowledge_tool,
     memory_search_tool,
@@ -0,0 +1,330 @@
+"""In-process IVF vector index over a memory-mapped snapshot of rag_chunks.
+
+The snapshot lives in ``root``: ``embeddings.f32`` holds unit-normalized rows,
+``docs.jsonl`` the matching ids/content/metadata and ``meta.json`` the change
+marker (the newest ``createdAt`` seen). Refreshes only pull documents created at
+or after the marker; a periodic full rebuild picks up edits and deletions.
+"""
+
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from google.cloud.firestore_v1 import FieldFilter
+
+_ASSIGN_CHUNK = 8192
+
+
+def _to_datetime(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str) and value:
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return np.divide(matrix, norms, out=np.zeros_like(matrix), where=norms > 0)
+
+
+@dataclass
+class _Ivf:
+    centroids: np.ndarray
+    assignments: np.ndarray
+    order: np.ndarray
+    offsets: np.ndarray
+    trained_rows: int
+
+
+@dataclass
+class _Snapshot:
+    matrix: np.ndarray
+    docs: List[Dict[str, Any]]
+    ids: set
+    marker: Optional[datetime]
+    ivf: Optional[_Ivf]
+    built_at: float
+    refreshed_at: float
+
+
+def _train_ivf(matrix: np.ndarray, *, iterations: int = 8, seed: int = 0) -> _Ivf:
+    rows = matrix.shape[0]
+    lists = max(1, int(math.sqrt(rows)))
+    rng = np.random.default_rng(seed)
+    sample_size = min(rows, lists * 64)
+    sample = np.asarray(matrix[np.sort(rng.choice(rows, size=sample_size, replace=False))])
+    centroids = sample[rng.choice(sample_size, size=lists, replace=False)].copy()
+
+    # Spherical k-means: assign by cosine, re-centre, re-normalize.
+    for _ in range(iterations):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]
+        centroids = _normalize(sums)
+
+    return _build_lists(centroids, _assign(matrix, centroids), rows)
+
+
+def _assign(matrix: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    labels = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], _ASSIGN_CHUNK):
+        block = np.asarray(matrix[start : start + _ASSIGN_CHUNK])
+        labels[start : start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def _build_lists(centroids: np.ndarray, assignments: np.ndarray, trained_rows: int) -> _Ivf:
+    order = np.argsort(assignments, kind='stable').astype(np.int64)
+    offsets = np.searchsorted(assignments[order], np.arange(centroids.shape[0] + 1))
+    return _Ivf(centroids=centroids, assignments=assignments, order=order, offsets=offsets, trained_rows=trained_rows)
+
+
+class LocalVectorIndex:
+    """Top-k cosine search over a local snapshot of a vector collection.
+
+    Small snapshots are searched exhaustively; from ``ivf_min_rows`` rows an IVF
+    index probes the ``nprobe`` closest lists. ``search`` never blocks on I/O:
+    until a snapshot exists it returns None and the caller falls back to Firestore.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        *,
+        load_collection: Callable[[], Any],
+        refresh_seconds: int = 300,
+        rebuild_seconds: int = 21600,
+        ivf_min_rows: int = 4096,
+        nprobe: int = 16,
+    ) -> None:
+        self._root = root
+        self._load_collection = load_collection
+        self._refresh_seconds = max(1, refresh_seconds)
+        self._rebuild_seconds = max(self._refresh_seconds, rebuild_seconds)
+        self._ivf_min_rows = max(1, ivf_min_rows)
+        self._nprobe = max(1, nprobe)
+        self._snapshot: Optional[_Snapshot] = None
+        self._refreshing = threading.Lock()
+        self._attempted_at = 0.0
+        self._loaded = False
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._root, name)
+
+    def _load_from_disk(self) -> Optional[_Snapshot]:
+        try:
+            with open(self._path('meta.json'), 'r', encoding='utf-8') as handle:
+                meta = json.load(handle)
+            with open(self._path('docs.jsonl'), 'r', encoding='utf-8') as handle:
+                docs = [json.loads(line) for line in handle if line.strip()]
+            dimension = int(meta['dimension'])
+            rows = min(len(docs), os.path.getsize(self._path('embeddings.f32')) // (4 * dimension))
+        except (OSError, ValueError, KeyError):
+            return None
+        if not rows:
+            return None
+        docs = docs[:rows]
+        matrix = np.memmap(self._path('embeddings.f32'), dtype=np.float32, mode='r', shape=(rows, dimension))
+        ivf = _train_ivf(matrix) if rows >= self._ivf_min_rows else None
+        return _Snapshot(
+            matrix=matrix,
+            docs=docs,
+            ids={doc['id'] for doc in docs},
+            marker=_to_datetime(meta.get('marker')),
+            ivf=ivf,
+            built_at=float(meta.get('builtAt') or 0),
+            refreshed_at=0.0,
+        )
+
+    def _fetch(self, marker: Optional[datetime]) -> Tuple[List[Dict[str, Any]], Optional[np.ndarray], Optional[datetime]]:
+        query = self._load_collection()
+        if marker is not None:
+            query = query.where(filter=FieldFilter('createdAt', '>=', marker)).order_by('createdAt')
+        docs: List[Dict[str, Any]] = []
+        vectors: List[List[float]] = []
+        newest = marker
+        for doc in query.stream():
+            data = doc.to_dict() or {}
+            embedding = data.get('embedding')
+            if embedding is None:
+                continue
+            created_at = _to_datetime(data.get('createdAt'))
+            if created_at is not None and (newest is None or created_at > newest):
+                newest = created_at
+            docs.append({
+                'id': doc.id,
+                'content': data.get('content', ''),
+                'metadata': data.get('metadata') or {},
+                'createdAt': created_at.isoformat() if created_at else None,
+            })
+            vectors.append([float(value) for value in embedding])
+        if not vectors:
+            return docs, None, newest
+        return docs, _normalize(np.asarray(vectors, dtype=np.float32)), newest
+
+    def _write_meta(self, dimension: int, marker: Optional[datetime], built_at: float) -> None:
+        temp = self._path('meta.json.tmp')
+        with open(temp, 'w', encoding='utf-8') as handle:
+            json.dump({'dimension': dimension, 'marker': marker.isoformat() if marker else None, 'builtAt': built_at}, handle)
+        os.replace(temp, self._path('meta.json'))
+
+    def _rebuild(self) -> Optional[_Snapshot]:
+        docs, matrix, marker = self._fetch(None)
+        if matrix is None:
+            return None
+        os.makedirs(self._root, exist_ok=True)
+        for name, payload in (
+            ('embeddings.f32', matrix.tobytes()),
+            ('docs.jsonl', ''.join(json.dumps(doc, default=str) + '\n' for doc in docs).encode('utf-8')),
+        ):
+            temp = self._path(f'{name}.tmp')
+            with open(temp, 'wb') as handle:
+                handle.write(payload)
+            os.replace(temp, self._path(name))
+        now = time.time()
+        self._write_meta(matrix.shape[1], marker, now)
+
+        mapped = np.memmap(self._path('embeddings.f32'), dtype=np.float32, mode='r', shape=matrix.shape)
+        ivf = _train_ivf(mapped) if matrix.shape[0] >= self._ivf_min_rows else None
+        return _Snapshot(
+            matrix=mapped,
+            docs=docs,
+            ids={doc['id'] for doc in docs},
+            marker=marker,
+            ivf=ivf,
+            built_at=now,
+            refreshed_at=now,
+        )
+
+    def _extend(self, snapshot: _Snapshot) -> _Snapshot:
+        docs, matrix, marker = self._fetch(snapshot.marker)
+        now = time.time()
+        fresh = [i for i, doc in enumerate(docs) if doc['id'] not in snapshot.ids]
+        if matrix is None or not fresh or matrix.shape[1] != snapshot.matrix.shape[1]:
+            return replace(snapshot, marker=marker or snapshot.marker, refreshed_at=now)
+
+        new_docs = [docs[i] for i in fresh]
+        new_rows = matrix[fresh]
+        with open(self._path('embeddings.f32'), 'ab') as handle:
+            handle.write(new_rows.tobytes())
+        with open(self._path('docs.jsonl'), 'a', encoding='utf-8') as handle:
+            handle.write(''.join(json.dumps(doc, default=str) + '\n' for doc in new_docs))
+        self._write_meta(new_rows.shape[1], marker, snapshot.built_at)
+
+        rows = snapshot.matrix.shape[0] + new_rows.shape[0]
+        mapped = np.memmap(self._path('embeddings.f32'), dtype=np.float32, mode='r', shape=(rows, new_rows.shape[1]))
+        ivf = snapshot.ivf
+        if rows >= self._ivf_min_rows and (ivf is None or rows > 2 * ivf.trained_rows):
+            ivf = _train_ivf(mapped)
+        elif ivf is not None:
+            assignments = np.concatenate([ivf.assignments, _assign(new_rows, ivf.centroids)])
+            ivf = _build_lists(ivf.centroids, assignments, ivf.trained_rows)
+        return _Snapshot(
+            matrix=mapped,
+            docs=snapshot.docs + new_docs,
+            ids=snapshot.ids | {doc['id'] for doc in new_docs},
+            marker=marker,
+            ivf=ivf,
+            built_at=snapshot.built_at,
+            refreshed_at=now,
+        )
+
+    def refresh(self) -> None:
+        """Brings the snapshot up to date; a full rebuild when none exists or it is older than ``rebuild_seconds``."""
+        if not self._refreshing.acquire(blocking=False):
+            return
+        self._attempted_at = time.time()
+        try:
+            if not self._loaded:
+                self._loaded = True
+                self._snapshot = self._load_from_disk()
+            snapshot = self._snapshot
+            if snapshot is None or time.time() - snapshot.built_at > self._rebuild_seconds:
+                self._snapshot = self._rebuild() or snapshot
+            else:
+                self._snapshot = self._extend(snapshot)
+        except Exception as exc:  # pragma: no cover - network/runtime dependent
+            print(f'[VectorIndex] refresh failed: {exc}')
+        finally:
+            self._refreshing.release()
+
+    def _refresh_if_due(self) -> None:
+        # Paced by the last attempt, not the last success, so an empty collection or a
+        # failing rebuild is retried every ``refresh_seconds`` instead of on every search.
+        if time.time() - self._attempted_at < self._refresh_seconds:
+            return
+        if self._refreshing.locked():
+            return
+        threading.Thread(target=self.refresh, name='vector-index-refresh', daemon=True).start()
+
+    def search(
+        self,
+        vector: Any,
+        limit: int,
+        *,
+        predicate: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ) -> Optional[List[Tuple[Dict[str, Any], float]]]:
+        """``(doc, cosine similarity)`` pairs best first, or None while no snapshot is available.
+
+        With a ``predicate`` only matching docs are scored, exhaustively.
+        """
+        self._refresh_if_due()
+        snapshot = self._snapshot
+        if snapshot is None or limit <= 0:
+            return None
+        query = np.asarray(vector, dtype=np.float32)
+        if query.shape != (snapshot.matrix.shape[1],):
+            return None
+        norm = float(np.linalg.norm(query))
+        if norm == 0:
+            return []
+        query = query / norm
+
+        if predicate is not None:
+            candidates = np.fromiter(
+                (row for row, doc in enumerate(snapshot.docs) if predicate(doc)),
+                dtype=np.int64,
+            )
+            scores = snapshot.matrix[candidates] @ query
+        elif snapshot.ivf is None:
+            candidates = None
+            scores = snapshot.matrix @ query
+        else:
+            ivf = snapshot.ivf
+            probes = np.argsort(ivf.centroids @ query)[::-1][: self._nprobe]
+            # Sorted row ids keep the gather from the memory map mostly sequential.
+            candidates = np.sort(np.concatenate([ivf.order[ivf.offsets[p] : ivf.offsets[p + 1]] for p in probes]))
+            scores = snapshot.matrix[candidates] @ query
+
+        count = min(limit, scores.shape[0])
+        if not count:
+            return []
+        top = np.argpartition(-scores, count - 1)[:count]
+        top = top[np.argsort(-scores[top])]
+        rows = top if candidates is None else candidates[top]
+        return [(snapshot.docs[int(row)], float(scores[i])) for row, i in zip(rows, top)]
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return {'rows': 0, 'ivfLists': 0}
+        return {
+            'rows': int(snapshot.matrix.shape[0]),
+            'ivfLists': int(snapshot.ivf.centroids.shape[0]) if snapshot.ivf else 0,
+            'marker': snapshot.marker.isoformat() if snapshot.marker else None,
+            'refreshedAt': snapshot.refreshed_at,
+        }
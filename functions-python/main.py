@@ -16,7 +16,8 @@ import firebase_admin
 from firebase_admin import storage
 from firebase_functions import https_fn, options
 from avanza_service import AvanzaService
-from adk.handlers import advisorChatPy, advisorChatStreamPy
+from adk.handlers import advisorChatPy, advisorChatStreamPy, adkMaintenancePy
+from adk.market_data import load_yahoo_frame
 
 # Initialize Firebase Admin
 if not firebase_admin._apps:
@@ -135,14 +136,16 @@ def generate_chart(request: https_fn.Request) -> https_fn.Response:
         period = request_json.get("period", "1mo")
         return_type = request_json.get("returnType", "image")
 
-        # 1. Fetch data
-        import yfinance as yf
+        # 1. Fetch data (from the local price store when the period maps to a start date)
+        data = load_yahoo_frame(symbol, interval, period)
+        if data is None:
+            import yfinance as yf
 
-        data = yf.download(symbol, period=period, interval=interval, progress=False)
+            data = yf.download(symbol, period=period, interval=interval, progress=False)
 
-        # Fix for yfinance multi-index columns
-        if isinstance(data.columns, pd.MultiIndex):
-            data.columns = data.columns.get_level_values(0)
+            # Fix for yfinance multi-index columns
+            if isinstance(data.columns, pd.MultiIndex):
+                data.columns = data.columns.get_level_values(0)
 
         if data.empty:
             return https_fn.Response(